@@ -1,6 +1,6 @@
 import os
 from dotenv import load_dotenv
-load_dotenv()
+load_dotenv(override=False)
 class Config:
     """Application configuration"""
     SECRET_KEY = os.getenv('SECRET_KEY', 'your-secret-key-here')
@@ -9,11 +9,16 @@ class Config:
     VERIFY_TOKEN = os.getenv("VERIFY_TOKEN")
     TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+    GEMINI_MAX_OUTPUT_TOKENS = int(os.getenv("GEMINI_MAX_OUTPUT_TOKENS", "2048"))
     NOMINATIM_USER_AGENT = os.getenv("NOMINATIM_USER_AGENT", "MedSenseAI/1.0")
     OVERPASS_API_URL = os.getenv("OVERPASS_API_URL", "https://overpass-api.de/api/interpreter")
     NOMINATIM_API_URL = os.getenv("NOMINATIM_API_URL", "https://nominatim.openstreetmap.org")
     RAPIDAPI_KEY = os.getenv('RAPIDAPI_KEY')
+    RAPIDAPI_HOST = os.getenv('RAPIDAPI_HOST', 'endlessmedicalapi1.p.rapidapi.com')
+    ENDLESSMEDICAL_API_URL = os.getenv('ENDLESSMEDICAL_API_URL', 'https://api.endlessmedical.com/v1/dx')
+    WHO_DON_API_URL = os.getenv('WHO_DON_API_URL', 'https://www.who.int/api/news/diseaseoutbreaknews')
     GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
     DATABASE_PATH = 'medsense_history.db'
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
     SESSION_CLEANUP_HOURS = 48
     SESSION_TIMEOUT = 1800
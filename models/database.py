@@ -1,102 +1,172 @@
 """Database initialization and connection management"""
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
+from utils.logger import get_logger
+log = get_logger(__name__)
+DB_PATH = 'medsense_history.db'
+_READER_CONNECTIONS = 4
+_CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA busy_timeout=5000",
+)
+_SCHEMA_DDL = """
+BEGIN IMMEDIATE;
+CREATE TABLE IF NOT EXISTS symptom_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    symptoms TEXT NOT NULL,
+    diagnosis TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    body_part TEXT,
+    severity TEXT,
+    location_lat REAL,
+    location_lon REAL,
+    location_address TEXT
+);
+CREATE TABLE IF NOT EXISTS diagnosis_feedback (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    history_id INTEGER NOT NULL,
+    feedback TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    FOREIGN KEY (history_id) REFERENCES symptom_history(id)
+);
+CREATE TABLE IF NOT EXISTS user_profiles (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT UNIQUE NOT NULL,
+    age INTEGER,
+    gender TEXT,
+    timestamp INTEGER NOT NULL,
+    platform TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_locations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    address TEXT,
+    timestamp INTEGER NOT NULL,
+    platform TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS user_countries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT UNIQUE NOT NULL,
+    country TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    platform TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS disease_notifications (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    disease_name TEXT NOT NULL,
+    country TEXT NOT NULL,
+    who_event_id TEXT NOT NULL,
+    notification_sent BOOLEAN DEFAULT FALSE,
+    timestamp INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS follow_up_reminders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    symptoms TEXT NOT NULL,
+    diagnosis_id INTEGER NOT NULL,
+    scheduled_time INTEGER NOT NULL,
+    sent BOOLEAN DEFAULT FALSE,
+    response_received BOOLEAN DEFAULT FALSE,
+    user_response TEXT,
+    timestamp INTEGER NOT NULL,
+    FOREIGN KEY (diagnosis_id) REFERENCES symptom_history(id)
+);
+CREATE TABLE IF NOT EXISTS geocache (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    ts INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_hist_user_ts ON symptom_history(user_id, timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_loc_user_ts ON user_locations(user_id, timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_notifications_user ON disease_notifications(user_id, who_event_id);
+CREATE INDEX IF NOT EXISTS idx_followup_user ON follow_up_reminders(user_id, sent, response_received);
+CREATE INDEX IF NOT EXISTS idx_followup_sched ON follow_up_reminders(scheduled_time) WHERE sent = FALSE;
+CREATE INDEX IF NOT EXISTS idx_geocache_ts ON geocache(ts);
+COMMIT;
+"""
+# Rewrites timestamps stored as local-time text by older releases into epoch seconds, then
+# refreshes planner statistics once rather than holding the write lock for ANALYZE on every boot
+_SCHEMA_VERSION = 1
+_EPOCH_COLUMNS = (
+    ("symptom_history", "timestamp"),
+    ("diagnosis_feedback", "timestamp"),
+    ("user_profiles", "timestamp"),
+    ("user_locations", "timestamp"),
+    ("user_countries", "timestamp"),
+    ("disease_notifications", "timestamp"),
+    ("follow_up_reminders", "timestamp"),
+    ("follow_up_reminders", "scheduled_time"),
+)
+_MIGRATE_EPOCH_DDL = "BEGIN IMMEDIATE;\n" + "".join(
+    f"UPDATE {table} SET {column} = CAST(strftime('%s', {column}, 'utc') AS INTEGER) "
+    f"WHERE typeof({column}) = 'text' AND strftime('%s', {column}, 'utc') IS NOT NULL;\n"
+    for table, column in _EPOCH_COLUMNS
+) + f"ANALYZE;\nPRAGMA user_version = {_SCHEMA_VERSION};\nCOMMIT;\n"
+_pools = None
+_pools_lock = threading.Lock()
+def _open_pooled_connection(db_path):
+    """Open a WAL-mode connection that can be shared across request threads"""
+    conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+    for pragma in _CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+def get_pool(readonly=True):
+    """Get the reader or writer connection pool, creating both on first use"""
+    global _pools
+    if _pools is None:
+        with _pools_lock:
+            if _pools is None:
+                writer = queue.Queue()
+                writer.put(_open_pooled_connection(DB_PATH))
+                readers = queue.Queue()
+                for _ in range(_READER_CONNECTIONS):
+                    readers.put(_open_pooled_connection(DB_PATH))
+                _pools = {True: readers, False: writer}
+    return _pools[readonly]
+@contextmanager
+def borrow_conn(readonly=True):
+    """Borrow a pooled connection; the single writer connection serialises writes"""
+    pool = get_pool(readonly)
+    conn = pool.get()
+    try:
+        yield conn
+    finally:
+        pool.put(conn)
 def get_db_connection(db_path='medsense_history.db'):
     """Get database connection"""
     try:
         conn = sqlite3.connect(db_path)
         return conn
-    except Exception as e:
-        print(f"Database connection error: {e}")
+    except Exception:
+        log.exception("Database connection error")
         return None
 def init_database():
     """Initialize database with all required tables"""
     try:
-        conn = sqlite3.connect('medsense_history.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS symptom_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT NOT NULL,
-                platform TEXT NOT NULL,
-                symptoms TEXT NOT NULL,
-                diagnosis TEXT NOT NULL,
-                timestamp DATETIME NOT NULL,
-                body_part TEXT,
-                severity TEXT,
-                location_lat REAL,
-                location_lon REAL,
-                location_address TEXT
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS diagnosis_feedback (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT NOT NULL,
-                history_id INTEGER NOT NULL,
-                feedback TEXT NOT NULL,
-                timestamp DATETIME NOT NULL,
-                FOREIGN KEY (history_id) REFERENCES symptom_history(id)
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_profiles (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT UNIQUE NOT NULL,
-                age INTEGER,
-                gender TEXT,
-                timestamp DATETIME NOT NULL,
-                platform TEXT NOT NULL
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_locations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT NOT NULL,
-                latitude REAL NOT NULL,
-                longitude REAL NOT NULL,
-                address TEXT,
-                timestamp DATETIME NOT NULL,
-                platform TEXT NOT NULL
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_countries (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT UNIQUE NOT NULL,
-                country TEXT NOT NULL,
-                timestamp DATETIME NOT NULL,
-                platform TEXT NOT NULL
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS disease_notifications (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT NOT NULL,
-                disease_name TEXT NOT NULL,
-                country TEXT NOT NULL,
-                who_event_id TEXT NOT NULL,
-                notification_sent BOOLEAN DEFAULT FALSE,
-                timestamp DATETIME NOT NULL
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS follow_up_reminders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT NOT NULL,
-                platform TEXT NOT NULL,
-                symptoms TEXT NOT NULL,
-                diagnosis_id INTEGER NOT NULL,
-                scheduled_time DATETIME NOT NULL,
-                sent BOOLEAN DEFAULT FALSE,
-                response_received BOOLEAN DEFAULT FALSE,
-                user_response TEXT,
-                timestamp DATETIME NOT NULL,
-                FOREIGN KEY (diagnosis_id) REFERENCES symptom_history(id)
-            )
-        ''')
-        conn.commit()
-        conn.close()
-        print("✅ Database initialized successfully")
+        with borrow_conn(readonly=False) as conn:
+            try:
+                conn.executescript(_SCHEMA_DDL)
+                if conn.execute("PRAGMA user_version").fetchone()[0] < _SCHEMA_VERSION:
+                    conn.executescript(_MIGRATE_EPOCH_DDL)
+                    log.info("✅ Migrated stored timestamps to epoch seconds")
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+        log.info("✅ Database initialized successfully")
     except Exception as e:
-        print(f"❌ Database initialization error: {e}")
-        raise e 
+        log.error("❌ Database initialization error: %s", e)
+        raise e
\ No newline at end of file
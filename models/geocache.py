@@ -0,0 +1,39 @@
+"""Persistent cache for geocoding and nearby-facility lookups, shared across workers and restarts"""
+import threading
+import time
+import orjson
+from models.database import borrow_conn
+from utils.logger import get_logger
+log = get_logger(__name__)
+# OSM data must not be kept longer than 30 days; expired rows are pruned on write
+GEOCACHE_MAX_AGE = 30 * 86400
+_PRUNE_INTERVAL = 3600
+_SQL_GET = 'SELECT value FROM geocache WHERE key = ? AND ts > ?'
+_SQL_PUT = 'INSERT OR REPLACE INTO geocache (key, value, ts) VALUES (?, ?, ?)'
+_SQL_PRUNE = 'DELETE FROM geocache WHERE ts <= ?'
+_prune_lock = threading.Lock()
+_next_prune = 0.0
+def get_cached(key, max_age=GEOCACHE_MAX_AGE):
+    """Return the decoded value stored under key if younger than max_age seconds, else None"""
+    try:
+        with borrow_conn() as conn:
+            row = conn.execute(_SQL_GET, (key, int(time.time()) - max_age)).fetchone()
+        return orjson.loads(row[0]) if row else None
+    except Exception as e:
+        log.error("Error reading geocache: %s", e)
+        return None
+def put_cached(key, value):
+    """Store a JSON-serialisable value under key, pruning expired rows at most once an hour"""
+    global _next_prune
+    now = int(time.time())
+    with _prune_lock:
+        prune = time.monotonic() >= _next_prune
+        if prune:
+            _next_prune = time.monotonic() + _PRUNE_INTERVAL
+    try:
+        with borrow_conn(readonly=False) as conn:
+            conn.execute(_SQL_PUT, (key, orjson.dumps(value).decode(), now))
+            if prune:
+                conn.execute(_SQL_PRUNE, (now - GEOCACHE_MAX_AGE,))
+    except Exception as e:
+        log.error("Error writing geocache: %s", e)
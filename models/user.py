@@ -1,245 +1,458 @@
 """User-related database operations"""
-import sqlite3
-from datetime import datetime, timedelta
-from models.database import get_db_connection
+import atexit
+import queue
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, TimeoutError
+from typing import NamedTuple, Optional
+from models.database import borrow_conn
+from utils.helpers import format_profile_for_analysis
+from utils.logger import get_logger
+log = get_logger(__name__)
+class UserProfile(NamedTuple):
+    """Stored profile for a user"""
+    age: Optional[int]
+    gender: Optional[str]
+    platform: Optional[str]
+class UserLocation(NamedTuple):
+    """A saved user location"""
+    lat: float
+    lon: float
+    address: Optional[str]
+_SQL_SAVE_PROFILE = '''
+    INSERT INTO user_profiles (user_id, age, gender, timestamp, platform)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        age = excluded.age,
+        gender = excluded.gender,
+        timestamp = excluded.timestamp,
+        platform = excluded.platform
+'''
+_SQL_GET_PROFILE = '''
+    SELECT age, gender, platform FROM user_profiles WHERE user_id = ?
+'''
+_SQL_INSERT_LOCATION = '''
+    INSERT INTO user_locations (user_id, latitude, longitude, address, timestamp, platform)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+_SQL_GET_RECENT_LOCATION = '''
+    SELECT latitude, longitude, address FROM user_locations
+    WHERE user_id = ? AND timestamp >= ?
+    ORDER BY timestamp DESC LIMIT 1
+'''
+_SQL_UPSERT_COUNTRY = '''
+    INSERT INTO user_countries (user_id, country, timestamp, platform)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(user_id) DO UPDATE SET
+        country = excluded.country,
+        timestamp = excluded.timestamp,
+        platform = excluded.platform
+    WHERE country <> excluded.country OR platform <> excluded.platform
+'''
+_SQL_GET_COUNTRY = 'SELECT country FROM user_countries WHERE user_id = ?'
+_SQL_GET_HISTORY = '''
+    SELECT symptoms, diagnosis, timestamp, body_part, severity
+    FROM symptom_history
+    WHERE user_id = ? AND timestamp >= ?
+    ORDER BY timestamp DESC
+    LIMIT ?
+'''
+_SQL_HAS_HISTORY = 'SELECT EXISTS(SELECT 1 FROM symptom_history WHERE user_id = ?)'
+_SQL_HAS_PROFILE_OR_HISTORY = '''
+    SELECT EXISTS(SELECT 1 FROM user_profiles WHERE user_id = ?)
+        OR EXISTS(SELECT 1 FROM symptom_history WHERE user_id = ?)
+'''
+_SQL_GET_HISTORY_ID = '''
+    SELECT id FROM symptom_history
+    WHERE user_id = ? AND timestamp = ?
+'''
+_SQL_GET_PENDING_FOLLOWUPS = '''
+    SELECT id, user_id, platform, symptoms, diagnosis_id, scheduled_time
+    FROM follow_up_reminders
+    WHERE sent = FALSE AND scheduled_time <= ?
+    ORDER BY scheduled_time ASC
+'''
+_SQL_CLAIM_DUE_FOLLOWUPS = '''
+    UPDATE follow_up_reminders
+    SET sent = TRUE
+    WHERE id IN (
+        SELECT id FROM follow_up_reminders
+        WHERE sent = FALSE AND scheduled_time <= ?
+        ORDER BY scheduled_time ASC
+        LIMIT ?
+    )
+    RETURNING id, user_id, platform, symptoms, diagnosis_id, scheduled_time
+'''
+_SQL_RELEASE_FOLLOWUPS = '''
+    UPDATE follow_up_reminders SET sent = FALSE
+    WHERE id IN ({}) AND sent = TRUE AND response_received = FALSE
+    RETURNING user_id
+'''
+_SQL_COUNT_AWAITING_FOLLOWUPS = '''
+    SELECT user_id, COUNT(*) FROM follow_up_reminders
+    WHERE sent = TRUE AND response_received = FALSE
+    GROUP BY user_id
+'''
+_SQL_SAVE_FOLLOWUP_RESPONSE = '''
+    UPDATE follow_up_reminders
+    SET response_received = TRUE, user_response = ?
+    WHERE user_id = ? AND sent = TRUE AND response_received = FALSE
+    ORDER BY scheduled_time DESC
+    LIMIT 1
+'''
+_SQL_INSERT_HISTORY = '''
+    INSERT INTO symptom_history (user_id, platform, symptoms, diagnosis, timestamp, body_part, severity, location_lat, location_lon, location_address)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    RETURNING id
+'''
+_SQL_INSERT_FOLLOWUP = '''
+    INSERT INTO follow_up_reminders (user_id, platform, symptoms, diagnosis_id, scheduled_time, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+_SQL_INSERT_FEEDBACK = '''
+    INSERT INTO diagnosis_feedback (user_id, history_id, feedback, timestamp)
+    VALUES (?, ?, ?, ?)
+'''
+_FOLLOWUP_DELAY = 24 * 3600
+_FOLLOWUP_CLAIM_LIMIT = 50
+_MAX_SQL_VARIABLES = 900
+_WRITE_BATCH_SIZE = 64
+_WRITE_FLUSH_INTERVAL = 0.2
+_PROFILE_CACHE_SIZE = 4096
+_PROFILE_CACHE_TTL = 300
+_profile_cache = OrderedDict()
+_profile_text_cache = OrderedDict()
+_country_cache = OrderedDict()
+_user_cache_lock = threading.Lock()
+# Per-process count of sent-but-unanswered follow-ups per user; re-read from the database on
+# every claim cycle so follow-ups claimed or answered in other worker processes are picked up
+_awaiting_followups = None
+_awaiting_lock = threading.Lock()
+_write_queue = queue.Queue()
+_writer_thread = None
+_writer_lock = threading.Lock()
+_WRITER_STOP = object()
+def _drain_write_queue(first):
+    """Collect queued writes until the batch is full or the flush interval passes"""
+    batch = [first]
+    if _write_queue.empty():
+        # Idle server: a lone write goes out right away instead of waiting for company
+        return batch
+    deadline = time.monotonic() + _WRITE_FLUSH_INTERVAL
+    while len(batch) < _WRITE_BATCH_SIZE:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            item = _write_queue.get(timeout=remaining)
+        except queue.Empty:
+            break
+        if item is _WRITER_STOP:
+            # Leave the stop marker for the worker loop once this batch is written
+            _write_queue.put(item)
+            break
+        batch.append(item)
+    return batch
+def _flush_writes(conn, batch):
+    """Write one batch of history and feedback rows in a single transaction"""
+    # Callers that gave up waiting cancel their future; those rows are dropped, not written late
+    batch = [item for item in batch if item[2] is None or item[2].set_running_or_notify_cancel()]
+    feedback_rows = [params for kind, params, _ in batch if kind == "feedback"]
+    history_ids = []
+    cursor = conn.cursor()
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        for kind, params, future in batch:
+            if kind == "history":
+                history_row, followup_row = params
+                history_id = cursor.execute(_SQL_INSERT_HISTORY, history_row).fetchone()[0]
+                cursor.execute(_SQL_INSERT_FOLLOWUP, followup_row[:3] + (history_id,) + followup_row[3:])
+                history_ids.append((future, history_id))
+        if feedback_rows:
+            cursor.executemany(_SQL_INSERT_FEEDBACK, feedback_rows)
+        cursor.execute("COMMIT")
+    except Exception as e:
+        if conn.in_transaction:
+            cursor.execute("ROLLBACK")
+        for _, _, future in batch:
+            if future is not None:
+                future.set_exception(e)
+        raise
+    for future, history_id in history_ids:
+        future.set_result(history_id)
+def _write_behind_worker():
+    """Background writer that batches history and feedback inserts"""
+    while True:
+        first = _write_queue.get()
+        if first is _WRITER_STOP:
+            return
+        batch = _drain_write_queue(first)
+        try:
+            with borrow_conn(readonly=False) as conn:
+                _flush_writes(conn, batch)
+        except Exception as e:
+            log.error("Error flushing %s queued writes: %s", len(batch), e)
+def _enqueue_write(kind, params, future=None):
+    """Queue a write for the background writer, starting it on first use"""
+    global _writer_thread
+    if _writer_thread is None:
+        with _writer_lock:
+            if _writer_thread is None:
+                _writer_thread = threading.Thread(target=_write_behind_worker, name="history-writer", daemon=True)
+                _writer_thread.start()
+    _write_queue.put((kind, params, future))
+def _stop_writer():
+    """Flush any queued writes before the interpreter exits"""
+    if _writer_thread is not None:
+        _write_queue.put(_WRITER_STOP)
+        _writer_thread.join(timeout=10)
+atexit.register(_stop_writer)
+_MISS = object()
+def _cache_lookup(cache, user_id):
+    """Return a live cached value for user_id, or _MISS"""
+    with _user_cache_lock:
+        cached = cache.get(user_id)
+        if cached and cached[0] > time.monotonic():
+            cache.move_to_end(user_id)
+            return cached[1]
+    return _MISS
+def _cache_store(cache, user_id, value):
+    """Cache a per-user value, evicting the least recently used entry when full"""
+    with _user_cache_lock:
+        cache[user_id] = (time.monotonic() + _PROFILE_CACHE_TTL, value)
+        cache.move_to_end(user_id)
+        if len(cache) > _PROFILE_CACHE_SIZE:
+            cache.popitem(last=False)
 def save_user_profile(user_id, age, gender, platform):
     """Save or update user profile"""
     try:
-        conn = sqlite3.connect('medsense_history.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT OR REPLACE INTO user_profiles (user_id, age, gender, timestamp, platform)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (user_id, age, gender, datetime.now(), platform))
-        conn.commit()
-        conn.close()
-        print(f"Saved profile for user {user_id}: age {age}, gender {gender}")
+        with borrow_conn(readonly=False) as conn:
+            conn.execute(_SQL_SAVE_PROFILE, (user_id, age, gender, int(time.time()), platform))
+        invalidate_user_profile(user_id)
+        log.info("Saved profile for user %s: age %s, gender %s", user_id, age, gender)
         return True
     except Exception as e:
-        print(f"Error saving user profile: {e}")
+        log.error("Error saving user profile: %s", e)
         return False
+def invalidate_user_profile(user_id):
+    """Drop cached profile data for a user after their stored profile changes"""
+    with _user_cache_lock:
+        _profile_cache.pop(user_id, None)
+        _profile_text_cache.pop(user_id, None)
 def get_user_profile(user_id):
-    """Get user profile information"""
-    try:
-        conn = sqlite3.connect('medsense_history.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT age, gender FROM user_profiles WHERE user_id = ?
-        ''', (user_id,))
-        result = cursor.fetchone()
-        conn.close()
-        if result:
-            return {"age": result[0], "gender": result[1]}
-        return None
+    """Get user profile information, served from a short-lived per-user cache"""
+    profile = _cache_lookup(_profile_cache, user_id)
+    if profile is not _MISS:
+        return profile
+    try:
+        with borrow_conn() as conn:
+            result = conn.execute(_SQL_GET_PROFILE, (user_id,)).fetchone()
+        profile = UserProfile(*result) if result else None
+        _cache_store(_profile_cache, user_id, profile)
+        return profile
     except Exception as e:
-        print(f"Error retrieving user profile: {e}")
+        log.error("Error retrieving user profile: %s", e)
         return None
+def get_profile_text(user_id):
+    """Get the rendered profile block for analysis prompts, cached per user"""
+    profile = get_user_profile(user_id)
+    # Text is only reused while it was rendered from the currently cached profile,
+    # so a render racing with invalidate_user_profile can't outlive the change
+    cached = _cache_lookup(_profile_text_cache, user_id)
+    if cached is not _MISS and cached[0] is profile:
+        return cached[1]
+    profile_text = format_profile_for_analysis(profile)
+    _cache_store(_profile_text_cache, user_id, (profile, profile_text))
+    return profile_text
 def is_new_user(user_id):
     """Check if user is new (no profile and no history)"""
-    profile = get_user_profile(user_id)
-    history = get_user_history(user_id)
-    return profile is None and len(history) == 0
+    profile = _cache_lookup(_profile_cache, user_id)
+    if profile is not _MISS and profile is not None:
+        return False
+    try:
+        with borrow_conn() as conn:
+            if profile is _MISS:
+                return not conn.execute(_SQL_HAS_PROFILE_OR_HISTORY, (user_id, user_id)).fetchone()[0]
+            return not conn.execute(_SQL_HAS_HISTORY, (user_id,)).fetchone()[0]
+    except Exception as e:
+        log.error("Error checking user history: %s", e)
+        return True
 def save_user_location(user_id, latitude, longitude, address, platform):
     """Save user location data"""
     try:
-        conn = sqlite3.connect('medsense_history.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO user_locations (user_id, latitude, longitude, address, timestamp, platform)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (user_id, latitude, longitude, address, datetime.now(), platform))
-        conn.commit()
-        conn.close()
-        print(f"Saved location for user {user_id}: {latitude}, {longitude}")
+        with borrow_conn(readonly=False) as conn:
+            conn.execute(_SQL_INSERT_LOCATION, (user_id, latitude, longitude, address, int(time.time()), platform))
+        log.info("Saved location for user %s: %s, %s", user_id, latitude, longitude)
         return True
     except Exception as e:
-        print(f"Error saving user location: {e}")
+        log.error("Error saving user location: %s", e)
         return False
 def get_user_recent_location(user_id, hours_back=24):
     """Get user's most recent location within specified timeframe"""
     try:
-        conn = sqlite3.connect('medsense_history.db')
-        cursor = conn.cursor()
-        cutoff_time = datetime.now() - timedelta(hours=hours_back)
-        cursor.execute('''
-            SELECT latitude, longitude, address FROM user_locations 
-            WHERE user_id = ? AND timestamp >= ?
-            ORDER BY timestamp DESC LIMIT 1
-        ''', (user_id, cutoff_time))
-        result = cursor.fetchone()
-        conn.close()
+        with borrow_conn() as conn:
+            cutoff_time = int(time.time()) - hours_back * 3600
+            result = conn.execute(_SQL_GET_RECENT_LOCATION, (user_id, cutoff_time)).fetchone()
         if result:
-            return {"lat": result[0], "lon": result[1], "address": result[2]}
+            return UserLocation(*result)
         return None
     except Exception as e:
-        print(f"Error retrieving user location: {e}")
+        log.error("Error retrieving user location: %s", e)
         return None
 def save_user_country(user_id, country, platform):
     """Save user's country for disease outbreak notifications"""
     try:
-        conn = sqlite3.connect('medsense_history.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT OR REPLACE INTO user_countries (user_id, country, timestamp, platform)
-            VALUES (?, ?, ?, ?)
-        ''', (user_id, country, datetime.now(), platform))
-        conn.commit()
-        conn.close()
-        print(f"Saved country {country} for user {user_id}")
+        with borrow_conn(readonly=False) as conn:
+            conn.execute(_SQL_UPSERT_COUNTRY, (user_id, country, int(time.time()), platform))
+        with _user_cache_lock:
+            _country_cache.pop(user_id, None)
+        log.info("Saved country %s for user %s", country, user_id)
         return True
     except Exception as e:
-        print(f"Error saving user country: {e}")
+        log.error("Error saving user country: %s", e)
         return False
 def get_user_country(user_id):
-    """Get user's country for disease outbreak checking"""
+    """Get user's country for disease outbreak checking, served from a per-user cache"""
+    country = _cache_lookup(_country_cache, user_id)
+    if country is not _MISS:
+        return country
     try:
-        conn = sqlite3.connect('medsense_history.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT country FROM user_countries WHERE user_id = ?', (user_id,))
-        result = cursor.fetchone()
-        conn.close()
-        return result[0] if result else None
+        with borrow_conn() as conn:
+            result = conn.execute(_SQL_GET_COUNTRY, (user_id,)).fetchone()
+        country = result[0] if result else None
+        _cache_store(_country_cache, user_id, country)
+        return country
     except Exception as e:
-        print(f"Error retrieving user country: {e}")
+        log.error("Error retrieving user country: %s", e)
         return None
 def save_diagnosis_to_history(user_id, platform, symptoms, diagnosis, body_part=None, severity=None, location_data=None):
     """Save diagnosis to user's medical history"""
     try:
-        conn = sqlite3.connect('medsense_history.db')
-        cursor = conn.cursor()
-        lat, lon, address = None, None, None
-        if location_data:
-            lat = location_data.get('lat')
-            lon = location_data.get('lon')
-            address = location_data.get('address')
-        cursor.execute('''
-            INSERT INTO symptom_history (user_id, platform, symptoms, diagnosis, timestamp, body_part, severity, location_lat, location_lon, location_address)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (user_id, platform, symptoms, diagnosis, datetime.now(), body_part, severity, lat, lon, address))
-        history_id = cursor.lastrowid
-        followup_time = datetime.now() + timedelta(hours=24)
-        cursor.execute('''
-            INSERT INTO follow_up_reminders (user_id, platform, symptoms, diagnosis_id, scheduled_time, timestamp)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (user_id, platform, symptoms, history_id, followup_time, datetime.now()))
-        conn.commit()
-        conn.close()
-        print(f"Saved diagnosis to history for user {user_id} with 24h follow-up scheduled")
+        lat, lon, address = location_data if location_data else (None, None, None)
+        now = int(time.time())
+        history_row = (user_id, platform, symptoms, diagnosis, now, body_part, severity, lat, lon, address)
+        followup_row = (user_id, platform, symptoms, now + _FOLLOWUP_DELAY, now)
+        future = Future()
+        _enqueue_write("history", (history_row, followup_row), future)
+        try:
+            history_id = future.result(timeout=10)
+        except TimeoutError:
+            if future.cancel():
+                raise
+            # Already being written; wait for its id rather than orphan the follow-up
+            history_id = future.result()
+        log.info("Saved diagnosis to history for user %s with 24h follow-up scheduled", user_id)
         return history_id
     except Exception as e:
-        print(f"Error saving to database: {e}")
+        log.error("Error saving to database: %s", e)
         return None
-def get_user_history(user_id, days_back=365):
-    """Get user's medical history"""
-    try:
-        conn = sqlite3.connect('medsense_history.db')
-        cursor = conn.cursor()
-        cutoff_date = datetime.now() - timedelta(days=days_back)
-        cursor.execute('''
-            SELECT symptoms, diagnosis, timestamp, body_part, severity 
-            FROM symptom_history 
-            WHERE user_id = ? AND timestamp >= ?
-            ORDER BY timestamp DESC
-        ''', (user_id, cutoff_date))
-        history = cursor.fetchall()
-        conn.close()
+def get_user_history(user_id, days_back=365, limit=None):
+    """Get user's medical history, newest first, optionally capped at limit rows"""
+    try:
+        with borrow_conn() as conn:
+            cutoff_date = int(time.time()) - days_back * 86400
+            history = conn.execute(_SQL_GET_HISTORY, (user_id, cutoff_date, -1 if limit is None else limit)).fetchall()
         return history
     except Exception as e:
-        print(f"Error retrieving history: {e}")
+        log.error("Error retrieving history: %s", e)
         return []
 def get_history_id(user_id, timestamp):
     """Get history ID for a specific timestamp"""
     try:
-        conn = sqlite3.connect('medsense_history.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT id FROM symptom_history 
-            WHERE user_id = ? AND timestamp = ?
-        ''', (user_id, timestamp))
-        result = cursor.fetchone()
-        conn.close()
+        with borrow_conn() as conn:
+            result = conn.execute(_SQL_GET_HISTORY_ID, (user_id, timestamp)).fetchone()
         return result[0] if result else None
     except Exception as e:
-        print(f"Error retrieving history_id: {e}")
+        log.error("Error retrieving history_id: %s", e)
         return None
 def save_feedback(user_id, history_id, feedback):
-    """Save user feedback for a diagnosis"""
-    try:
-        conn = sqlite3.connect('medsense_history.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO diagnosis_feedback (user_id, history_id, feedback, timestamp)
-            VALUES (?, ?, ?, ?)
-        ''', (user_id, history_id, feedback, datetime.now()))
-        conn.commit()
-        conn.close()
-        print(f"Saved feedback for user {user_id}, history_id {history_id}")
-    except Exception as e:
-        print(f"Error saving feedback: {e}")
+    """Queue user feedback for a diagnosis"""
+    try:
+        _enqueue_write("feedback", (user_id, history_id, feedback, int(time.time())))
+        log.info("Queued feedback for user %s, history_id %s", user_id, history_id)
+    except Exception as e:
+        log.error("Error saving feedback: %s", e)
 def get_pending_followups():
     """Get all pending follow-up reminders that are due"""
     try:
-        conn = sqlite3.connect('medsense_history.db')
-        cursor = conn.cursor()
-        current_time = datetime.now()
-        cursor.execute('''
-            SELECT id, user_id, platform, symptoms, diagnosis_id, scheduled_time
-            FROM follow_up_reminders 
-            WHERE sent = FALSE AND scheduled_time <= ?
-            ORDER BY scheduled_time ASC
-        ''', (current_time,))
-        followups = cursor.fetchall()
-        conn.close()
+        with borrow_conn() as conn:
+            current_time = int(time.time())
+            followups = conn.execute(_SQL_GET_PENDING_FOLLOWUPS, (current_time,)).fetchall()
         return followups
     except Exception as e:
-        print(f"Error retrieving pending follow-ups: {e}")
+        log.error("Error retrieving pending follow-ups: %s", e)
         return []
-def mark_followup_sent(followup_id):
-    """Mark a follow-up reminder as sent"""
-    try:
-        conn = sqlite3.connect('medsense_history.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE follow_up_reminders 
-            SET sent = TRUE 
-            WHERE id = ?
-        ''', (followup_id,))
-        conn.commit()
-        conn.close()
+def _load_awaiting_followups():
+    """Count sent-but-unanswered follow-ups per user, loading them once; call with _awaiting_lock held"""
+    if _awaiting_followups is None:
+        with borrow_conn() as conn:
+            _reload_awaiting_followups(conn)
+    return _awaiting_followups
+def _reload_awaiting_followups(conn):
+    """Replace the open follow-up counts with the database's; call with _awaiting_lock held"""
+    global _awaiting_followups
+    _awaiting_followups = Counter(dict(conn.execute(_SQL_COUNT_AWAITING_FOLLOWUPS).fetchall()))
+def _adjust_awaiting_followups(user_ids, delta):
+    """Apply delta to each user's open follow-up count; call with _awaiting_lock held"""
+    for user_id in user_ids:
+        _awaiting_followups[user_id] += delta
+        if _awaiting_followups[user_id] <= 0:
+            del _awaiting_followups[user_id]
+def claim_due_followups(limit=_FOLLOWUP_CLAIM_LIMIT):
+    """Atomically mark due follow-up reminders as sent and return them"""
+    try:
+        with _awaiting_lock:
+            with borrow_conn(readonly=False) as conn:
+                followups = conn.execute(_SQL_CLAIM_DUE_FOLLOWUPS, (int(time.time()), limit)).fetchall()
+                # Counts now include this claim as well as anything other workers claimed or answered
+                _reload_awaiting_followups(conn)
+        followups.sort(key=lambda followup: followup[5])
+        return followups
+    except Exception as e:
+        log.error("Error claiming due follow-ups: %s", e)
+        return []
+def release_followups(followup_ids):
+    """Return claimed follow-up reminders to the pending queue after failed sends"""
+    followup_ids = list(followup_ids)
+    if not followup_ids:
+        return True
+    try:
+        with _awaiting_lock:
+            _load_awaiting_followups()
+            released = []
+            with borrow_conn(readonly=False) as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    for start in range(0, len(followup_ids), _MAX_SQL_VARIABLES):
+                        chunk = followup_ids[start:start + _MAX_SQL_VARIABLES]
+                        released += conn.execute(_SQL_RELEASE_FOLLOWUPS.format(", ".join("?" * len(chunk))), chunk).fetchall()
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+            _adjust_awaiting_followups((row[0] for row in released), -1)
         return True
     except Exception as e:
-        print(f"Error marking follow-up as sent: {e}")
+        log.error("Error releasing follow-ups: %s", e)
         return False
 def save_followup_response(user_id, response_text):
     """Save user's response to a follow-up check-in"""
     try:
-        conn = sqlite3.connect('medsense_history.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE follow_up_reminders 
-            SET response_received = TRUE, user_response = ?
-            WHERE user_id = ? AND sent = TRUE AND response_received = FALSE
-            ORDER BY scheduled_time DESC
-            LIMIT 1
-        ''', (response_text, user_id))
-        conn.commit()
-        conn.close()
+        with _awaiting_lock:
+            _load_awaiting_followups()
+            with borrow_conn(readonly=False) as conn:
+                answered = conn.execute(_SQL_SAVE_FOLLOWUP_RESPONSE, (response_text, user_id)).rowcount
+            _adjust_awaiting_followups([user_id] * answered, -1)
         return True
     except Exception as e:
-        print(f"Error saving follow-up response: {e}")
+        log.error("Error saving follow-up response: %s", e)
         return False
 def is_followup_response_expected(user_id):
-    """Check if a follow-up response is expected from this user"""
-    try:
-        conn = sqlite3.connect('medsense_history.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT COUNT(*) FROM follow_up_reminders 
-            WHERE user_id = ? AND sent = TRUE AND response_received = FALSE
-        ''', (user_id,))
-        count = cursor.fetchone()[0]
-        conn.close()
-        return count > 0
-    except Exception as e:
-        print(f"Error checking follow-up response status: {e}")
+    """Check if a follow-up response is expected from this user, using the in-memory open follow-up counts"""
+    try:
+        with _awaiting_lock:
+            return _load_awaiting_followups()[user_id] > 0
+    except Exception as e:
+        log.error("Error checking follow-up response status: %s", e)
         return False 
@@ -0,0 +1,51 @@
+"""Typed webhook payloads for WhatsApp and Telegram"""
+from typing import List, Optional
+import msgspec
+class WAText(msgspec.Struct):
+    """WhatsApp text message body"""
+    body: str
+class WAImage(msgspec.Struct):
+    """WhatsApp image attachment"""
+    id: str
+    caption: Optional[str] = None
+class WALocation(msgspec.Struct):
+    """WhatsApp shared location"""
+    latitude: float
+    longitude: float
+class WAMessage(msgspec.Struct):
+    """Single inbound WhatsApp message"""
+    from_: str = msgspec.field(name="from")
+    id: Optional[str] = None
+    type: Optional[str] = None
+    text: Optional[WAText] = None
+    image: Optional[WAImage] = None
+    location: Optional[WALocation] = None
+class WAValue(msgspec.Struct):
+    """Change value; status-only deliveries carry no messages"""
+    messages: List[WAMessage] = []
+class WAChange(msgspec.Struct):
+    value: WAValue
+class WAEntry(msgspec.Struct):
+    changes: List[WAChange]
+class WAWebhook(msgspec.Struct):
+    """Top-level WhatsApp Cloud API webhook delivery"""
+    entry: List[WAEntry]
+class TGChat(msgspec.Struct):
+    id: int
+class TGPhotoSize(msgspec.Struct):
+    file_id: str
+class TGLocation(msgspec.Struct):
+    latitude: float
+    longitude: float
+class TGMessage(msgspec.Struct):
+    """Inbound Telegram message (only the fields the bot reads)"""
+    message_id: Optional[int] = None
+    chat: Optional[TGChat] = None
+    text: Optional[str] = None
+    photo: Optional[List[TGPhotoSize]] = None
+    location: Optional[TGLocation] = None
+class TGUpdate(msgspec.Struct):
+    """Top-level Telegram update"""
+    message: Optional[TGMessage] = None
+decode_whatsapp_webhook = msgspec.json.Decoder(WAWebhook).decode
+decode_telegram_update = msgspec.json.Decoder(TGUpdate).decode
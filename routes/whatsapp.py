@@ -1,54 +1,68 @@
 """WhatsApp webhook routes"""
 import threading
 import time
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from flask import Blueprint, request, current_app
 from services.message_service import (
     send_whatsapp_message, get_whatsapp_image_url, download_and_encode_whatsapp_image
 )
 from services.message_processor import get_message_processor
 from services.session_service import get_session_service
+from models.webhook import decode_whatsapp_webhook
 from utils.constants import (
     IMAGE_ERROR_MSG, PROCESSING_TEXT_MSG, 
     PROCESSING_IMAGE_MSG, PROCESSING_LOCATION_MSG
 )
+from utils.chat_queue import ChatQueue
+from utils.logger import get_logger
 
+log = get_logger(__name__)
 whatsapp_bp = Blueprint('whatsapp', __name__)
 
-# Message deduplication for WhatsApp webhooks
-processed_messages = {}
+# Bounded worker pools for background message processing; images get their own
+# small pool so slow downloads and vision calls don't queue ahead of text
+_background_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="wa-bg")
+_image_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="wa-img")
+# Messages from one chat are handled in arrival order so profile-setup answers can't race
+_chat_queue = ChatQueue()
 
-def clean_old_messages():
-    """Clean messages older than 5 minutes"""
-    cutoff = datetime.now() - timedelta(minutes=5)
-    to_remove = [msg_id for msg_id, timestamp in processed_messages.items() if timestamp < cutoff]
-    for msg_id in to_remove:
-        del processed_messages[msg_id]
+# Message deduplication for WhatsApp webhooks: message id -> monotonic expiry,
+# kept in arrival order so expired (or, past the cap, oldest) ids are popped from the front
+_DEDUP_WINDOW = 300
+_DEDUP_MAX_ENTRIES = 10000
+processed_messages = OrderedDict()
+_processed_lock = threading.Lock()
 
 def is_duplicate_message(message_id):
-    """Check if we've already processed this message"""
-    clean_old_messages()
-    if message_id in processed_messages:
-        return True
-    processed_messages[message_id] = datetime.now()
-    return False
+    """Check if we've already processed this message, remembering it for 5 minutes"""
+    now = time.monotonic()
+    with _processed_lock:
+        while processed_messages and next(iter(processed_messages.values())) <= now:
+            processed_messages.popitem(last=False)
+        if message_id in processed_messages:
+            return True
+        processed_messages[message_id] = now + _DEDUP_WINDOW
+        if len(processed_messages) > _DEDUP_MAX_ENTRIES:
+            processed_messages.popitem(last=False)
+        return False
 
 def _process_whatsapp_message_background(sender, message_type, content, app_context):
     """Process WhatsApp message in background thread"""
     try:
         # Push Flask app context for background thread
         with app_context.app_context():
-            print(f"🔄 WHATSAPP BG: Background processing started for {sender}")
+            log.debug("🔄 WHATSAPP BG: Background processing started for %s", sender)
             
             message_processor = get_message_processor()
             response = None
             
             if message_type == "text":
                 body, immediate_msg = content
-                print(f"📝 WHATSAPP BG: Processing text message: '{body[:50]}...'")
+                log.debug("📝 WHATSAPP BG: Processing text message: '%.50s...'", body)
                 
                 # Send immediate processing message
-                print(f"⚡ WHATSAPP BG: Sending immediate processing message to {sender}")
+                log.debug("⚡ WHATSAPP BG: Sending immediate processing message to %s", sender)
                 send_whatsapp_message(sender, immediate_msg)
                 
                 # Process the message
@@ -56,10 +70,10 @@ def _process_whatsapp_message_background(sender, message_type, content, app_cont
                 
             elif message_type == "image":
                 media_id, caption_text, immediate_msg = content
-                print(f"🖼️ WHATSAPP BG: Processing image message for {sender}")
+                log.debug("🖼️ WHATSAPP BG: Processing image message for %s", sender)
                 
                 # Send immediate processing message
-                print(f"⚡ WHATSAPP BG: Sending immediate processing message to {sender}")
+                log.debug("⚡ WHATSAPP BG: Sending immediate processing message to %s", sender)
                 send_whatsapp_message(sender, immediate_msg)
                 
                 # Download and process the image
@@ -75,10 +89,10 @@ def _process_whatsapp_message_background(sender, message_type, content, app_cont
                 
             elif message_type == "location":
                 latitude, longitude, immediate_msg = content
-                print(f"📍 WHATSAPP BG: Processing location message for {sender}")
+                log.debug("📍 WHATSAPP BG: Processing location message for %s", sender)
                 
                 # Send immediate processing message
-                print(f"⚡ WHATSAPP BG: Sending immediate processing message to {sender}")
+                log.debug("⚡ WHATSAPP BG: Sending immediate processing message to %s", sender)
                 send_whatsapp_message(sender, immediate_msg)
                 
                 # Process the location
@@ -86,24 +100,52 @@ def _process_whatsapp_message_background(sender, message_type, content, app_cont
             
             # Send final response if available
             if response:
-                print(f"✅ WHATSAPP BG: Sending final response to {sender}")
+                log.debug("✅ WHATSAPP BG: Sending final response to %s", sender)
                 send_whatsapp_message(sender, response)
-                print(f"🎉 WHATSAPP BG: Background processing completed for {sender}")
+                log.debug("🎉 WHATSAPP BG: Background processing completed for %s", sender)
             else:
-                print(f"⚠️ WHATSAPP BG: No response generated for {sender}")
+                log.warning("⚠️ WHATSAPP BG: No response generated for %s", sender)
                 
     except Exception as e:
-        print(f"❌ WHATSAPP BG: Error in background processing for {sender}: {str(e)}")
+        log.error("❌ WHATSAPP BG: Error in background processing for %s: %s", sender, e)
         try:
             # Send error message to user
             error_msg = "I apologize, but I encountered a technical issue. Please try again or consult a healthcare professional if urgent."
             send_whatsapp_message(sender, error_msg)
         except:
-            print(f"❌ WHATSAPP BG: Failed to send error message to {sender}")
+            log.error("❌ WHATSAPP BG: Failed to send error message to %s", sender)
+
+def _dispatch_whatsapp_message(sender, msg, app_context):
+    """Route a queued WhatsApp message to profile setup or background analysis"""
+    try:
+        with app_context.app_context():
+            session_service = get_session_service()
+            
+            # Profile setup answers are handled without the processing notice
+            if session_service.is_in_profile_setup(sender):
+                if msg.text is not None:
+                    response = get_message_processor().handle_text_message(sender, msg.text.body, "whatsapp")
+                    if response:
+                        send_whatsapp_message(sender, response)
+                return
+    except Exception as e:
+        log.error("❌ WHATSAPP BG: Error dispatching message for %s: %s", sender, e)
+        return
+    
+    if msg.text is not None:
+        _process_whatsapp_message_background(sender, "text", (msg.text.body, PROCESSING_TEXT_MSG), app_context)
+    elif msg.image is not None:
+        _process_whatsapp_message_background(
+            sender, "image", (msg.image.id, msg.image.caption, PROCESSING_IMAGE_MSG), app_context
+        )
+    elif msg.location is not None:
+        _process_whatsapp_message_background(
+            sender, "location", (msg.location.latitude, msg.location.longitude, PROCESSING_LOCATION_MSG), app_context
+        )
 
 @whatsapp_bp.route("/webhook", methods=["GET", "POST"])
 def whatsapp_webhook():
-    """WhatsApp webhook endpoint with background processing"""
+    """WhatsApp webhook endpoint; all message handling runs on the background pool"""
     session_service = get_session_service()
     
     # Clean up inactive sessions
@@ -118,101 +160,37 @@ def whatsapp_webhook():
         return "Webhook verification failed - invalid token", 403
     
     try:
-        data = request.get_json()
-        entry = data['entry'][0]['changes'][0]['value']
-        messages = entry.get('messages', [])
+        payload = decode_whatsapp_webhook(request.get_data())
+        messages = payload.entry[0].changes[0].value.messages
         
         if not messages:
             return "No messages to process", 200
             
-        msg = messages[0]
-        sender = msg['from']
-        
-        # Track timing
-        start_time = time.time()
-        timestamp = datetime.now().strftime("%H:%M:%S.%f")
-        
-        print(f"📨 WHATSAPP: Received message from {sender} at {timestamp}")
-        
-        # Check for duplicate messages using WhatsApp message ID
-        message_id = msg.get('id')
-        if message_id and is_duplicate_message(message_id):
-            print(f"⚠️ WHATSAPP: Skipping duplicate message {message_id} from {sender}")
-            return "Duplicate message detected - already processed", 200
+        app = current_app._get_current_object()
+        queued = 0
+        # A delivery can batch several messages; queue each one that isn't a retry
+        for msg in messages:
+            sender = msg.from_
             
-        # Update session activity
-        session_service.update_session_activity(sender)
-        elapsed = time.time() - start_time
-        print(f"🔄 WHATSAPP: Session updated for {sender} at {elapsed:.3f}s")
-        
-        # Check if user is in profile setup (handle immediately)
-        if session_service.is_in_profile_setup(sender):
-            message_processor = get_message_processor()
-            if 'text' in msg:
-                body = msg['text']['body']
-                response = message_processor.handle_text_message(sender, body, "whatsapp")
-                if response:
-                    send_whatsapp_message(sender, response)
-            elapsed = time.time() - start_time
-            print(f"🏁 WHATSAPP: Webhook completed for {sender} in {elapsed:.3f}s")
-            return "Profile setup message processed successfully", 200
+            # Check for duplicate messages using WhatsApp message ID
+            message_id = msg.id
+            if message_id and is_duplicate_message(message_id):
+                log.warning("⚠️ WHATSAPP: Skipping duplicate message %s from %s", message_id, sender)
+                continue
+                
+            # Update session activity
+            session_service.update_session_activity(sender)
             
-        # Check if user should start profile setup
-        if session_service.should_start_profile_setup(sender):
-            print(f"✅ WHATSAPP: User {sender} not in profile setup, allowing processing message")
-        else:
-            print(f"✅ WHATSAPP: User {sender} not in profile setup, allowing processing message")
-        
-        # Get app context for background processing
-        app_context = current_app._get_current_object()
+            # Queue behind earlier messages from this chat and return before any database or network work
+            log.debug("📨 WHATSAPP: Queued message from %s", sender)
+            executor = _image_executor if msg.image is not None else _background_executor
+            _chat_queue.submit(executor, sender, _dispatch_whatsapp_message, sender, msg, app)
+            queued += 1
         
-        # Start background processing for different message types
-        if 'text' in msg:
-            body = msg['text']['body']
-            
-            print(f"🚀 WHATSAPP: Starting background processing for {sender} at {elapsed:.3f}s")
-            
-            # Start background thread for text processing
-            thread = threading.Thread(
-                target=_process_whatsapp_message_background,
-                args=(sender, "text", (body, PROCESSING_TEXT_MSG), app_context),
-                daemon=True
-            )
-            thread.start()
-            
-        elif 'image' in msg:
-            media_id = msg['image']['id']
-            caption_text = msg['image'].get('caption', None)
-            
-            print(f"🚀 WHATSAPP: Starting background processing for {sender} at {elapsed:.3f}s")
-            
-            # Start background thread for image processing
-            thread = threading.Thread(
-                target=_process_whatsapp_message_background,
-                args=(sender, "image", (media_id, caption_text, PROCESSING_IMAGE_MSG), app_context),
-                daemon=True
-            )
-            thread.start()
-            
-        elif 'location' in msg:
-            latitude = msg['location']['latitude']
-            longitude = msg['location']['longitude']
-            
-            print(f"🚀 WHATSAPP: Starting background processing for {sender} at {elapsed:.3f}s")
-            
-            # Start background thread for location processing
-            thread = threading.Thread(
-                target=_process_whatsapp_message_background,
-                args=(sender, "location", (latitude, longitude, PROCESSING_LOCATION_MSG), app_context),
-                daemon=True
-            )
-            thread.start()
-            
-        # Return success immediately
-        elapsed = time.time() - start_time
-        print(f"🏁 WHATSAPP: Webhook completed for {sender} in {elapsed:.3f}s")
+        if not queued:
+            return "Duplicate message detected - already processed", 200
         return "Message received - please give me a few seconds to process your request", 200
         
     except Exception as e:
-        print(f"❌ WHATSAPP: Webhook error: {str(e)}")
-        return "Error processing your request - please try again", 200  # Return 200 to prevent retries 
+        log.error("❌ WHATSAPP: Webhook error: %s", e)
+        return "Error processing your request - please try again", 200  # Return 200 to prevent retries
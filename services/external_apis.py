@@ -1,18 +1,147 @@
 """External API integrations for medical services"""
+import logging
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
+import threading
 import xml.etree.ElementTree as ET
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from flask import current_app
-from utils.helpers import calculate_distance
+from utils.helpers import calculate_distances, nearest_indices
 from models.user import get_user_country, save_user_country
+from models.geocache import get_cached, put_cached
 import re
 from datetime import datetime
-_endlessmedical_session = {"session_id": None, "initialized": False}
+from typing import NamedTuple
+from utils.logger import get_logger
+log = get_logger(__name__)
+# Base URL of the EndlessMedical endpoint that last accepted a session; sessions themselves
+# are per diagnosis and passed explicitly so concurrent users never share one
+_endlessmedical_base_url = None
+class Clinic(NamedTuple):
+    """A medical facility returned by find_nearby_clinics"""
+    name: str
+    type: str
+    distance: float
+    lat: float
+    lon: float
+# Reverse geocode cache keyed on coordinates quantized to ~100m; entries expire after a day
+# and are then re-read from the persistent geocache before Nominatim is asked again
+_GEOCODE_CACHE_SIZE = 50000
+_GEOCODE_CACHE_TTL = 86400
+_geocode_cache = OrderedDict()
+_geocode_lock = threading.Lock()
+_geocode_inflight = {}
+# Nominatim allows 1 request/second; only cache misses wait for a slot
+_NOMINATIM_INTERVAL = 1.0
+_nominatim_lock = threading.Lock()
+_nominatim_next_allowed = 0.0
+_OVERPASS_QUERY_TMPL = (
+    '[out:json][timeout:15];'
+    'nwr["amenity"~"^(hospital|clinic|doctors|pharmacy)$"]["name"](around:{radius},{lat},{lon});'
+    'out center qt;'
+)
+class _CappedRetry(Retry):
+    """Retry policy that never sleeps longer than backoff_max, even for a long Retry-After"""
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        return None if retry_after is None else min(retry_after, self.backoff_max)
+# Rate-limited and flapping upstreams get retried with jittered exponential backoff,
+# honouring Retry-After up to backoff_max; the final response is returned so callers see its status.
+# Read timeouts are not retried, so a slow upstream costs one timeout rather than four
+_TRANSIENT_RETRY = _CappedRetry(
+    total=3,
+    connect=3,
+    read=0,
+    backoff_factor=0.5,
+    backoff_jitter=0.25,
+    backoff_max=10,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=None,
+    respect_retry_after_header=True,
+    raise_on_status=False
+)
+# Keep-alive session for Overpass so repeat lookups skip the TLS handshake
+_overpass_session = requests.Session()
+_overpass_session.mount('https://', HTTPAdapter(pool_maxsize=8, max_retries=_TRANSIENT_RETRY))
+# WHO outbreak feed cache; freshness follows Cache-Control max-age when sent
+_WHO_CACHE_TTL = 3600
+_MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+_WHO_FAILURE_BACKOFF = 60
+_who_cache = {"expires": 0.0, "data": None, "index": None, "retry_after": 0.0}
+_who_cache_lock = threading.Lock()
+_who_refresh_lock = threading.Lock()
+_country_outbreaks_cache = {}
+_WORD_RE = re.compile(r'\w+')
+_OUTBREAK_PHRASES = ('outbreak in', 'epidemic in', 'cases in', 'reported in')
+_COUNTRY_ALIASES = {
+    'united states': ['usa', 'america', 'us', 'united states of america'],
+    'usa': ['united states', 'america', 'us', 'united states of america'],
+    'america': ['usa', 'united states', 'us', 'united states of america'],
+    'united kingdom': ['uk', 'britain', 'england', 'great britain'],
+    'uk': ['united kingdom', 'britain', 'england', 'great britain'],
+    'britain': ['uk', 'united kingdom', 'england', 'great britain'],
+    'south africa': ['rsa', 'republic of south africa'],
+    'democratic republic of congo': ['drc', 'congo drc', 'dr congo'],
+    'drc': ['democratic republic of congo', 'congo drc', 'dr congo'],
+    'china': ['peoples republic of china', 'prc'],
+    'russia': ['russian federation', 'ussr'],
+    'south korea': ['republic of korea', 'korea south'],
+    'north korea': ['democratic peoples republic of korea', 'korea north']
+}
+_OUTBREAK_OTHER_COUNTRIES = ['afghanistan', 'albania', 'algeria', 'argentina', 'australia', 'austria', 'bangladesh', 'belgium', 'brazil', 'canada', 'chile', 'colombia', 'denmark', 'egypt', 'ethiopia', 'finland', 'france', 'germany', 'ghana', 'greece', 'india', 'indonesia', 'iran', 'iraq', 'ireland', 'israel', 'italy', 'japan', 'kenya', 'malaysia', 'mexico', 'morocco', 'netherlands', 'nigeria', 'norway', 'pakistan', 'peru', 'philippines', 'poland', 'portugal', 'romania', 'saudi arabia', 'singapore', 'spain', 'sweden', 'switzerland', 'thailand', 'turkey', 'ukraine', 'venezuela', 'vietnam']
+# Keep-alive session shared by the EndlessMedical, WHO and PubMed clients
+_clinical_api_session = requests.Session()
+_clinical_api_session.mount('https://', HTTPAdapter(pool_connections=8, pool_maxsize=8, max_retries=_TRANSIENT_RETRY))
+# Nominatim gets its own session that only retries failed connects: a status retry would
+# bypass _wait_for_nominatim_slot and break the 1 request/second policy
+_nominatim_session = requests.Session()
+_nominatim_session.mount('https://', HTTPAdapter(pool_maxsize=8, max_retries=Retry(
+    total=2,
+    connect=2,
+    read=0,
+    status=0,
+    backoff_factor=0.5,
+    respect_retry_after_header=False,
+    raise_on_status=False
+)))
+# Search results for repeated (normalised) queries; failed searches are not cached
+_PUBMED_CACHE_SIZE = 256
+_PUBMED_CACHE_TTL = 3600
+_pubmed_cache = OrderedDict()
+_pubmed_cache_lock = threading.Lock()
+# Article pages don't change, so excerpts (including "nothing found") are kept per PMID for a day
+_FULLTEXT_CACHE_SIZE = 1024
+_FULLTEXT_CACHE_TTL = 86400
+_fulltext_cache = OrderedDict()
+_fulltext_cache_lock = threading.Lock()
+_fulltext_executor = ThreadPoolExecutor(max_workers=5, thread_name_prefix="pubmed-fulltext")
+# UpdateFeature calls are independent once a session is accepted, so they run concurrently
+_endlessmedical_feature_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="em-feature")
 def pubmed_search(query, max_results=5):
     """
     Enhanced PubMed search with full article content extraction
     Returns structured data with medical research articles including full text when available
     """
+    cache_key = (" ".join(query.lower().split()), max_results)
+    with _pubmed_cache_lock:
+        cached = _pubmed_cache.get(cache_key)
+        if cached is not None and cached[0] > time.monotonic():
+            _pubmed_cache.move_to_end(cache_key)
+            return cached[1]
+    articles = _search_pubmed(query, max_results)
+    if not articles[0].get('error'):
+        with _pubmed_cache_lock:
+            _pubmed_cache[cache_key] = (time.monotonic() + _PUBMED_CACHE_TTL, articles)
+            _pubmed_cache.move_to_end(cache_key)
+            if len(_pubmed_cache) > _PUBMED_CACHE_SIZE:
+                _pubmed_cache.popitem(last=False)
+    return articles
+def _search_pubmed(query, max_results):
+    """Run a PubMed esearch/efetch round trip and parse the matching articles"""
     try:
         medical_query = f"({query}) AND (medicine[Title/Abstract] OR clinical[Title/Abstract] OR treatment[Title/Abstract] OR diagnosis[Title/Abstract])"
         search_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
@@ -24,9 +153,9 @@ def pubmed_search(query, max_results=5):
             'sort': 'relevance',
             'usehistory': 'y'
         }
-        search_response = requests.get(search_url, params=search_params, timeout=10)
+        search_response = _clinical_api_session.get(search_url, params=search_params, timeout=10)
         search_response.raise_for_status()
-        search_data = search_response.json()
+        search_data = orjson.loads(search_response.content)
         pubmed_ids = search_data.get('esearchresult', {}).get('idlist', [])
         if not pubmed_ids:
             return [{"title": "No PubMed articles found", "body": "Try different medical terms", "href": "", "source": "PubMed"}]
@@ -36,18 +165,21 @@ def pubmed_search(query, max_results=5):
             'id': ','.join(pubmed_ids),
             'retmode': 'xml'
         }
-        fetch_response = requests.get(fetch_url, params=fetch_params, timeout=15)
+        fetch_response = _clinical_api_session.get(fetch_url, params=fetch_params, timeout=15)
         fetch_response.raise_for_status()
         root = ET.fromstring(fetch_response.content)
         articles = []
-        for article in root.findall('.//PubmedArticle')[:max_results]:
+        # Paths follow the PubmedArticleSet DTD so each lookup walks known children, not the whole subtree
+        for article in root.findall('PubmedArticle')[:max_results]:
             try:
-                medline_citation = article.find('.//MedlineCitation')
-                pmid = medline_citation.find('.//PMID').text if medline_citation.find('.//PMID') is not None else "Unknown"
-                title_elem = article.find('.//ArticleTitle')
+                medline_citation = article.find('MedlineCitation')
+                pmid_elem = medline_citation.find('PMID')
+                pmid = pmid_elem.text if pmid_elem is not None else "Unknown"
+                article_data = medline_citation.find('Article')
+                title_elem = article_data.find('ArticleTitle')
                 title = title_elem.text if title_elem is not None else "No Title Available"
                 abstract_parts = []
-                abstract_texts = article.findall('.//AbstractText')
+                abstract_texts = article_data.findall('Abstract/AbstractText')
                 if abstract_texts:
                     for abstract_text in abstract_texts:
                         label = abstract_text.get('Label', '')
@@ -59,14 +191,14 @@ def pubmed_search(query, max_results=5):
                     abstract = " ".join(abstract_parts)
                 else:
                     abstract = "No abstract available"
-                journal_elem = article.find('.//Journal/Title')
-                if not journal_elem:
-                    journal_elem = article.find('.//Journal/ISOAbbreviation')
+                journal_elem = article_data.find('Journal/Title')
+                if journal_elem is None:
+                    journal_elem = article_data.find('Journal/ISOAbbreviation')
                 journal = journal_elem.text if journal_elem is not None else "Unknown Journal"
-                year_elem = article.find('.//PubDate/Year')
+                year_elem = article_data.find('Journal/JournalIssue/PubDate/Year')
                 year = year_elem.text if year_elem is not None else "Unknown"
                 authors = []
-                for author in article.findall('.//Author')[:3]:
+                for author in article_data.findall('AuthorList/Author')[:3]:
                     lastname = author.find('LastName')
                     firstname = author.find('ForeName')
                     if lastname is not None and firstname is not None:
@@ -75,14 +207,9 @@ def pubmed_search(query, max_results=5):
                 if len(authors) >= 3:
                     author_text += " et al."
                 article_url = f"https://pubmed.ncbi.nlm.nih.gov/{pmid}/"
-                full_text_content = _attempt_full_text_extraction(pmid, article_url)
-                body = f"{abstract}\n\n"
-                if full_text_content:
-                    body += f"**Key Findings from Full Text:**\n{full_text_content}\n\n"
-                body += f"**Journal:** {journal} ({year})\n**Authors:** {author_text}\n**PMID:** {pmid}"
                 articles.append({
                     'title': title,
-                    'body': body,
+                    'body': None,
                     'href': article_url,
                     'source': 'PubMed',
                     'pmid': pmid,
@@ -90,63 +217,89 @@ def pubmed_search(query, max_results=5):
                     'year': year,
                     'authors': author_text,
                     'abstract': abstract,
-                    'full_text_excerpt': full_text_content or "Full text not accessible"
+                    'full_text_excerpt': None
                 })
-            except Exception as e:
-                print(f"Error parsing individual article: {e}")
+            except Exception:
+                log.exception("Error parsing individual article")
                 continue
+        # Article pages are scraped concurrently; each result is merged back in order
+        full_texts = _fulltext_executor.map(
+            lambda article: _attempt_full_text_extraction(article['pmid'], article['href']), articles
+        )
+        for article, full_text_content in zip(articles, full_texts):
+            body = f"{article['abstract']}\n\n"
+            if full_text_content:
+                body += f"**Key Findings from Full Text:**\n{full_text_content}\n\n"
+            body += f"**Journal:** {article['journal']} ({article['year']})\n**Authors:** {article['authors']}\n**PMID:** {article['pmid']}"
+            article['body'] = body
+            article['full_text_excerpt'] = full_text_content or "Full text not accessible"
         if not articles:
             return [{"title": "No detailed articles found", "body": "PubMed search completed but no article details available", "href": "", "source": "PubMed"}]
         return articles
     except requests.exceptions.RequestException as e:
-        print(f"Error in PubMed search (network): {e}")
+        log.error("Error in PubMed search (network): %s", e)
         return [{"error": f"PubMed search failed: Network error - {str(e)}"}]
     except ET.ParseError as e:
-        print(f"Error parsing PubMed XML: {e}")
+        log.error("Error parsing PubMed XML: %s", e)
         return [{"error": f"PubMed search failed: XML parsing error - {str(e)}"}]
     except Exception as e:
-        print(f"Error in PubMed search: {e}")
+        log.exception("Error in PubMed search")
         return [{"error": f"PubMed search failed: {str(e)}"}]
 def _attempt_full_text_extraction(pmid, pubmed_url):
     """
     Attempt to extract key content from PubMed article page
     """
+    with _fulltext_cache_lock:
+        cached = _fulltext_cache.get(pmid)
+        if cached is not None and cached[0] > time.monotonic():
+            _fulltext_cache.move_to_end(pmid)
+            return cached[1]
     try:
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
-        response = requests.get(pubmed_url, headers=headers, timeout=10)
+        response = _clinical_api_session.get(pubmed_url, headers=headers, timeout=10)
         if response.status_code == 200:
-            from bs4 import BeautifulSoup
-            soup = BeautifulSoup(response.content, 'html.parser')
-            key_sections = []
-            abstract_sections = soup.find_all(['div', 'p'], class_=lambda x: x and 'abstract' in x.lower())
-            for section in abstract_sections:
-                text = section.get_text(strip=True)
-                if any(keyword in text.lower() for keyword in ['conclusion', 'results', 'findings', 'significance']):
-                    key_sections.append(text[:200])
-            if key_sections:
-                return " ".join(key_sections)
-            conclusion_keywords = ['conclusion', 'results', 'findings', 'clinical significance']
-            all_text = soup.get_text()
-            for keyword in conclusion_keywords:
-                keyword_index = all_text.lower().find(keyword)
-                if keyword_index != -1:
-                    start = max(0, keyword_index - 50)
-                    end = min(len(all_text), keyword_index + 300)
-                    excerpt = all_text[start:end].strip()
-                    if len(excerpt) > 50:
-                        return excerpt
+            excerpt = _extract_key_findings(response.content)
+            with _fulltext_cache_lock:
+                _fulltext_cache[pmid] = (time.monotonic() + _FULLTEXT_CACHE_TTL, excerpt)
+                _fulltext_cache.move_to_end(pmid)
+                if len(_fulltext_cache) > _FULLTEXT_CACHE_SIZE:
+                    _fulltext_cache.popitem(last=False)
+            return excerpt
         return None
     except Exception as e:
-        print(f"Could not extract full text for PMID {pmid}: {e}")
+        log.warning("Could not extract full text for PMID %s: %s", pmid, e)
         return None
+def _extract_key_findings(page_content):
+    """Pull conclusion/results text out of a PubMed article page, or None if there is none"""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(page_content, 'html.parser')
+    key_sections = []
+    abstract_sections = soup.find_all(['div', 'p'], class_=lambda x: x and 'abstract' in x.lower())
+    for section in abstract_sections:
+        text = section.get_text(strip=True)
+        if any(keyword in text.lower() for keyword in ['conclusion', 'results', 'findings', 'significance']):
+            key_sections.append(text[:200])
+    if key_sections:
+        return " ".join(key_sections)
+    conclusion_keywords = ['conclusion', 'results', 'findings', 'clinical significance']
+    all_text = soup.get_text()
+    for keyword in conclusion_keywords:
+        keyword_index = all_text.lower().find(keyword)
+        if keyword_index != -1:
+            start = max(0, keyword_index - 50)
+            end = min(len(all_text), keyword_index + 300)
+            excerpt = all_text[start:end].strip()
+            if len(excerpt) > 50:
+                return excerpt
+    return None
 def duckduckgo_search(query, max_results=5):
     """
     DEPRECATED: DuckDuckGo search replaced with PubMed search for medical accuracy
     Redirects to pubmed_search for better medical content
     """
-    print("⚠️ DuckDuckGo search deprecated. Using PubMed search for medical accuracy.")
+    log.warning("⚠️ DuckDuckGo search deprecated. Using PubMed search for medical accuracy.")
     return pubmed_search(query, max_results)
 def web_search_medical(query, max_results=5):
     """
@@ -154,8 +307,53 @@ def web_search_medical(query, max_results=5):
     Optimized for medical and clinical content
     """
     return pubmed_search(query, max_results)
+def _wait_for_nominatim_slot():
+    """Block only as long as needed to respect the Nominatim rate limit"""
+    global _nominatim_next_allowed
+    with _nominatim_lock:
+        now = time.monotonic()
+        wait = _nominatim_next_allowed - now
+        if wait > 0:
+            time.sleep(wait)
+            now = _nominatim_next_allowed
+        _nominatim_next_allowed = now + _NOMINATIM_INTERVAL
+def _remember_geocode(cache_key, display_name):
+    """Store a display name in the in-process reverse geocode LRU"""
+    with _geocode_lock:
+        _geocode_cache[cache_key] = (time.monotonic() + _GEOCODE_CACHE_TTL, display_name)
+        _geocode_cache.move_to_end(cache_key)
+        if len(_geocode_cache) > _GEOCODE_CACHE_SIZE:
+            _geocode_cache.popitem(last=False)
 def reverse_geocode(latitude, longitude):
     """Convert coordinates to human-readable address using Nominatim"""
+    cache_key = (round(latitude, 3), round(longitude, 3))
+    with _geocode_lock:
+        cached = _geocode_cache.get(cache_key)
+        if cached is not None and cached[0] > time.monotonic():
+            _geocode_cache.move_to_end(cache_key)
+            return cached[1]
+        # Concurrent misses for the same area wait on the first caller's lookup
+        pending = _geocode_inflight.get(cache_key)
+        if pending is None:
+            future = _geocode_inflight[cache_key] = Future()
+    if pending is not None:
+        display_name = pending.result()
+    else:
+        display_name = None
+        try:
+            display_name = _lookup_reverse_geocode(cache_key, latitude, longitude)
+        finally:
+            with _geocode_lock:
+                del _geocode_inflight[cache_key]
+            future.set_result(display_name)
+    return display_name or f"Location: {latitude:.4f}, {longitude:.4f}"
+def _lookup_reverse_geocode(cache_key, latitude, longitude):
+    """Resolve a display name from the persistent geocache or Nominatim, or None on failure"""
+    persistent_key = f"geo:{cache_key[0]:.3f},{cache_key[1]:.3f}"
+    display_name = get_cached(persistent_key)
+    if display_name is not None:
+        _remember_geocode(cache_key, display_name)
+        return display_name
     try:
         nominatim_url = current_app.config.get('NOMINATIM_API_URL')
         user_agent = current_app.config.get('NOMINATIM_USER_AGENT')
@@ -167,494 +365,525 @@ def reverse_geocode(latitude, longitude):
             'addressdetails': 1
         }
         headers = {'User-Agent': user_agent}
-        response = requests.get(url, params=params, headers=headers, timeout=10)
-        time.sleep(1)
+        _wait_for_nominatim_slot()
+        response = _nominatim_session.get(url, params=params, headers=headers, timeout=10)
         if response.status_code == 200:
-            data = response.json()
+            data = orjson.loads(response.content)
             if 'display_name' in data:
+                _remember_geocode(cache_key, data['display_name'])
+                put_cached(persistent_key, data['display_name'])
                 return data['display_name']
-        return f"Location: {latitude:.4f}, {longitude:.4f}"
-    except Exception as e:
-        print(f"Error in reverse geocoding: {e}")
-        return f"Location: {latitude:.4f}, {longitude:.4f}"
+        return None
+    except Exception:
+        log.exception("Error in reverse geocoding")
+        return None
+def _fetch_nearby_facilities(latitude, longitude, radius_km):
+    """Query Overpass for (name, amenity, lat, lon) rows around a point and whether the answer is complete"""
+    overpass_url = current_app.config.get('OVERPASS_API_URL')
+    overpass_query = _OVERPASS_QUERY_TMPL.format(radius=radius_km * 1000, lat=latitude, lon=longitude)
+    response = _overpass_session.post(overpass_url, data=overpass_query, timeout=30)
+    if response.status_code != 200:
+        log.warning("⚠️ Overpass returned HTTP %s after retries", response.status_code)
+        return None, False
+    data = orjson.loads(response.content)
+    # Overpass reports runtime errors (timeouts, memory limits) as a remark on a 200 response
+    if 'remark' in data:
+        log.warning("⚠️ Overpass returned a partial result: %s", data['remark'])
+    facilities = []
+    for element in data.get('elements', []):
+        if element['type'] == 'node':
+            lat, lon = element['lat'], element['lon']
+        elif 'center' in element:
+            lat, lon = element['center']['lat'], element['center']['lon']
+        else:
+            continue
+        tags = element['tags']
+        facilities.append((tags['name'], tags['amenity'], lat, lon))
+    return facilities, 'remark' not in data
 def find_nearby_clinics(latitude, longitude, radius_km=5):
-    """Find nearby medical facilities using Overpass API"""
+    """Find nearby medical facilities using Overpass API, reusing persisted results for the same ~100m area"""
     try:
-        overpass_url = current_app.config.get('OVERPASS_API_URL')
-        overpass_query = f"""
-        [out:json][timeout:25];
-        (
-          node["amenity"~"^(hospital|clinic|doctors|pharmacy)$"](around:{radius_km*1000},{latitude},{longitude});
-          way["amenity"~"^(hospital|clinic|doctors|pharmacy)$"](around:{radius_km*1000},{latitude},{longitude});
-          relation["amenity"~"^(hospital|clinic|doctors|pharmacy)$"](around:{radius_km*1000},{latitude},{longitude});
-        );
-        out center meta;
-        """
-        response = requests.post(overpass_url, data=overpass_query, timeout=30)
-        if response.status_code == 200:
-            data = response.json()
-            clinics = []
-            for element in data.get('elements', [])[:5]:
-                if 'tags' in element:
-                    name = element['tags'].get('name', 'Medical Facility')
-                    amenity = element['tags'].get('amenity', 'clinic')
-                    if element['type'] == 'node':
-                        lat, lon = element['lat'], element['lon']
-                    elif 'center' in element:
-                        lat, lon = element['center']['lat'], element['center']['lon']
-                    else:
-                        continue
-                    distance = calculate_distance(latitude, longitude, lat, lon)
-                    clinics.append({
-                        'name': name,
-                        'type': amenity,
-                        'distance': round(distance, 2),
-                        'lat': lat,
-                        'lon': lon
-                    })
-            clinics.sort(key=lambda x: x['distance'])
-            return clinics[:3]
-        return []
-    except Exception as e:
-        print(f"Error finding nearby clinics: {e}")
+        persistent_key = f"osm:{latitude:.3f},{longitude:.3f}:{radius_km}"
+        facilities = get_cached(persistent_key)
+        if facilities is None:
+            facilities, complete = _fetch_nearby_facilities(latitude, longitude, radius_km)
+            if not facilities:
+                return []
+            # Only a complete, non-empty answer is persisted so one bad response can't hide an area for weeks
+            if complete:
+                put_cached(persistent_key, facilities)
+        if not facilities:
+            return []
+        distances = calculate_distances(
+            latitude, longitude,
+            [lat for _, _, lat, _ in facilities],
+            [lon for _, _, _, lon in facilities]
+        )
+        clinics = []
+        for i in nearest_indices(distances, 3):
+            name, amenity, lat, lon = facilities[i]
+            clinics.append(Clinic(
+                name=name,
+                type=amenity,
+                distance=round(float(distances[i]), 2),
+                lat=lat,
+                lon=lon
+            ))
+        return clinics
+    except Exception:
+        log.exception("Error finding nearby clinics")
         return []
 def fetch_who_disease_outbreaks():
-    """Fetch current disease outbreaks from WHO Disease Outbreak News API"""
+    """Fetch current disease outbreaks from WHO Disease Outbreak News API, shared across users"""
+    if _who_feed_usable():
+        return _who_cache["data"]
+    # Only one thread refreshes an expired feed; the rest wait and reuse its snapshot
+    with _who_refresh_lock:
+        if _who_feed_usable():
+            return _who_cache["data"]
+        data = _refresh_who_outbreaks()
+        if data is None:
+            # Serve the stale snapshot (if any) and hold off further downloads for a while
+            _who_cache["retry_after"] = time.monotonic() + _WHO_FAILURE_BACKOFF
+            return _who_cache["data"]
+        return data
+def _who_feed_usable():
+    """Whether callers should use the cached feed rather than download it again"""
+    now = time.monotonic()
+    if _who_cache["data"] is not None and now < _who_cache["expires"]:
+        return True
+    return now < _who_cache["retry_after"]
+def _refresh_who_outbreaks():
+    """Download and index the WHO outbreak feed, replacing the cached snapshot"""
     try:
-        who_api_url = "https://www.who.int/api/news/diseaseoutbreaknews"
+        who_api_url = current_app.config.get('WHO_DON_API_URL')
         headers = {
             'User-Agent': 'MedSenseAI/1.0 Medical Bot',
             'Accept': 'application/json'
         }
-        print(f"🌐 Fetching WHO disease outbreaks from: {who_api_url}")
-        response = requests.get(who_api_url, headers=headers, timeout=15)
-        print(f"📡 WHO API Response Status: {response.status_code}")
+        log.info("🌐 Fetching WHO disease outbreaks from: %s", who_api_url)
+        response = _clinical_api_session.get(who_api_url, headers=headers, timeout=15)
+        log.info("📡 WHO API Response Status: %s", response.status_code)
         if response.status_code == 200:
             try:
-                data = response.json()
-                print(f"📊 WHO API returned {len(data) if isinstance(data, list) else 'data'} outbreak entries")
+                data = orjson.loads(response.content)
+                log.info("📊 WHO API returned %s outbreak entries", len(data) if isinstance(data, list) else 'data')
+                max_age = _MAX_AGE_RE.search(response.headers.get('Cache-Control', ''))
+                ttl = int(max_age.group(1)) if max_age else _WHO_CACHE_TTL
+                with _who_cache_lock:
+                    _who_cache["index"] = _index_outbreak_entries(data)
+                    _who_cache["data"] = data
+                    _who_cache["expires"] = time.monotonic() + ttl
+                    _country_outbreaks_cache.clear()
                 return data
             except ValueError as json_error:
-                print(f"❌ JSON parsing error: {json_error}")
-                print(f"Raw response: {response.text[:200]}...")
+                log.error("❌ JSON parsing error: %s", json_error)
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("Raw response: %s...", response.text[:200])
                 return None
         else:
-            print(f"❌ WHO API returned status code: {response.status_code}")
-            print(f"Response: {response.text[:200]}...")
+            log.error("❌ WHO API returned status code: %s", response.status_code)
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("Response: %s...", response.text[:200])
             return None
     except requests.exceptions.Timeout:
-        print("⏱️ WHO API request timed out")
+        log.warning("⏱️ WHO API request timed out")
         return None
     except requests.exceptions.ConnectionError:
-        print("🌐 Connection error to WHO API")
+        log.warning("🌐 Connection error to WHO API")
         return None
-    except Exception as e:
-        print(f"💥 Error fetching WHO disease outbreaks: {e}")
+    except Exception:
+        log.exception("💥 Error fetching WHO disease outbreaks")
         return None
+class _OutbreakEntry(NamedTuple):
+    """A WHO outbreak report with the fields country matching needs, pre-lowercased"""
+    title: str
+    summary: str
+    overview: str
+    disease: str
+    formatted_date: str
+    year: int
+    title_lower: str
+    content_lower: str
+    regions_lower: str
+    has_outbreak_phrase: bool
+def _parse_outbreak_year(publication_date):
+    """Extract the publication year from a WHO date string, or None"""
+    if 'T' in publication_date:
+        return datetime.fromisoformat(publication_date.replace('Z', '+00:00')).year
+    if '-' in publication_date:
+        year_part = publication_date.split('-')[0]
+        if year_part.isdigit() and len(year_part) == 4:
+            return int(year_part)
+    elif publication_date.isdigit() and len(publication_date) == 4:
+        return int(publication_date)
+    return None
+def _index_outbreak_entries(outbreaks_data):
+    """Parse WHO entries once and index them by every word in their title, text and regions"""
+    if isinstance(outbreaks_data, list):
+        outbreak_entries = outbreaks_data
+    else:
+        outbreak_entries = outbreaks_data.get('value', outbreaks_data.get('data', outbreaks_data.get('outbreaks', [])))
+    entries = []
+    token_index = {}
+    for raw in outbreak_entries:
+        try:
+            title = raw.get('Title', raw.get('title', 'Unknown outbreak'))
+            summary = raw.get('Summary', raw.get('summary', ''))
+            overview = raw.get('Overview', raw.get('overview', ''))
+            publication_date = raw.get('PublicationDate', raw.get('PublicationDateAndTime', raw.get('DateCreated', '')))
+            if not publication_date:
+                continue
+            year = _parse_outbreak_year(publication_date)
+            if not year:
+                continue
+            disease_name = title
+            if ' – ' in title:  # WHO often uses this format: "Disease – Country"
+                disease_name = title.split(' – ')[0].strip()
+            elif '-' in title:
+                disease_name = title.split('-')[0].strip()
+            elif 'outbreak' in title.lower():
+                disease_name = title.replace('outbreak', '').replace('Outbreak', '').strip()
+            formatted_date = publication_date
+            if 'T' in publication_date:
+                formatted_date = datetime.fromisoformat(publication_date.replace('Z', '+00:00')).strftime('%Y-%m-%d')
+            regions = raw.get('regionscountries', raw.get('RegionsCountries', ''))
+            content_lower = f"{title} {summary} {overview}".lower()
+            entry = _OutbreakEntry(
+                title=title,
+                summary=summary,
+                overview=overview,
+                disease=disease_name,
+                formatted_date=formatted_date,
+                year=year,
+                title_lower=title.lower(),
+                content_lower=content_lower,
+                regions_lower=regions.lower() if isinstance(regions, str) else '',
+                has_outbreak_phrase=any(phrase in content_lower for phrase in _OUTBREAK_PHRASES)
+            )
+        except Exception as e:
+            log.warning("⚠️ Error processing outbreak entry: %s", e)
+            continue
+        entry_id = len(entries)
+        entries.append(entry)
+        for token in set(_WORD_RE.findall(f"{content_lower} {entry.regions_lower}")):
+            token_index.setdefault(token, []).append(entry_id)
+    log.info("🗂️ Indexed %s WHO outbreak entries", len(entries))
+    return entries, token_index
 def check_disease_outbreaks_for_user(user_id):
     """Check for disease outbreaks in user's country using WHO Disease Outbreak News API"""
     user_country = get_user_country(user_id)
     if not user_country:
-        print(f"⚠️ No country set for user {user_id}")
+        log.warning("⚠️ No country set for user %s", user_id)
         return []
-    print(f"🔍 Checking disease outbreaks for user {user_id} in country: {user_country}")
+    log.info("🔍 Checking disease outbreaks for user %s in country: %s", user_id, user_country)
+    country_key = user_country.lower().strip()
+    cached = _country_outbreaks_cache.get(country_key)
+    if cached and time.monotonic() < cached[0]:
+        return cached[1]
     outbreaks_data = fetch_who_disease_outbreaks()
     if not outbreaks_data:
-        print("❌ No outbreak data received from WHO API")
+        log.error("❌ No outbreak data received from WHO API")
         return []
+    entries, token_index = _who_cache["index"]
     relevant_outbreaks = []
-    current_year = datetime.now().year
-    cutoff_year = current_year - 2  # Only show outbreaks from last 2 years
-    
+    cutoff_year = datetime.now().year - 2  # Only show outbreaks from last 2 years
     try:
-        if isinstance(outbreaks_data, list):
-            outbreak_entries = outbreaks_data
-        else:
-            outbreak_entries = outbreaks_data.get('value', outbreaks_data.get('data', outbreaks_data.get('outbreaks', [])))
-        print(f"📋 Processing {len(outbreak_entries)} outbreak entries")
-        
-        for entry in outbreak_entries:
+        user_country_clean = country_key
+        country_variations = [user_country_clean] + _COUNTRY_ALIASES.get(user_country_clean, [])
+        other_countries = [c for c in _OUTBREAK_OTHER_COUNTRIES if c not in country_variations]
+        candidate_ids = set()
+        for country_var in country_variations:
+            # Tokenise exactly as the index was built so hyphenated or punctuated names still match
+            tokens = _WORD_RE.findall(country_var.lower())
+            if tokens:
+                candidate_ids.update(token_index.get(tokens[0], ()))
+        log.info("📋 Checking %s of %s outbreak entries mentioning %s", len(candidate_ids), len(entries), user_country)
+        # Newest first, so matching can stop once the 5 most recent relevant reports are found
+        for entry_id in sorted(candidate_ids, key=lambda i: (-entries[i].year, i)):
+            entry = entries[entry_id]
+            if entry.year < cutoff_year or len(relevant_outbreaks) >= 5:
+                break
             try:
-                title = entry.get('Title', entry.get('title', 'Unknown outbreak'))
-                summary = entry.get('Summary', entry.get('summary', ''))
-                overview = entry.get('Overview', entry.get('overview', ''))
-                publication_date = entry.get('PublicationDate', entry.get('PublicationDateAndTime', entry.get('DateCreated', '')))
-                
-                # IMPROVED DATE FILTERING - Skip old outbreaks
-                is_recent = False
-                outbreak_year = None
-                if publication_date:
-                    try:
-                        if 'T' in publication_date:
-                            parsed_date = datetime.fromisoformat(publication_date.replace('Z', '+00:00'))
-                            outbreak_year = parsed_date.year
-                        elif '-' in publication_date:
-                            # Handle YYYY-MM-DD format
-                            year_part = publication_date.split('-')[0]
-                            if year_part.isdigit() and len(year_part) == 4:
-                                outbreak_year = int(year_part)
-                        elif publication_date.isdigit() and len(publication_date) == 4:
-                            # Handle YYYY format
-                            outbreak_year = int(publication_date)
-                        
-                        if outbreak_year and outbreak_year >= cutoff_year:
-                            is_recent = True
-                        else:
-                            print(f"⏰ Skipping old outbreak from {outbreak_year}: {title[:50]}...")
-                            continue
-                    except Exception as date_error:
-                        print(f"⚠️ Date parsing error for '{publication_date}': {date_error}")
-                        # If we can't parse the date, skip it to be safe
-                        continue
-                else:
-                    # No date available, skip it
-                    print(f"📅 Skipping outbreak with no date: {title[:50]}...")
-                    continue
-                
-                if not is_recent:
-                    continue
-                
-                # IMPROVED COUNTRY MATCHING - More precise matching
-                user_country_clean = user_country.lower().strip()
-                
-                # Expand country variations more carefully
-                country_variations = [user_country_clean]
-                
-                # Add specific country mappings
-                country_mapping = {
-                    'united states': ['usa', 'america', 'us', 'united states of america'],
-                    'usa': ['united states', 'america', 'us', 'united states of america'],
-                    'america': ['usa', 'united states', 'us', 'united states of america'],
-                    'united kingdom': ['uk', 'britain', 'england', 'great britain'],
-                    'uk': ['united kingdom', 'britain', 'england', 'great britain'],
-                    'britain': ['uk', 'united kingdom', 'england', 'great britain'],
-                    'south africa': ['rsa', 'republic of south africa'],
-                    'democratic republic of congo': ['drc', 'congo drc', 'dr congo'],
-                    'drc': ['democratic republic of congo', 'congo drc', 'dr congo'],
-                    'china': ['peoples republic of china', 'prc'],
-                    'russia': ['russian federation', 'ussr'],
-                    'south korea': ['republic of korea', 'korea south'],
-                    'north korea': ['democratic peoples republic of korea', 'korea north']
-                }
-                
-                if user_country_clean in country_mapping:
-                    country_variations.extend(country_mapping[user_country_clean])
-                
-                # Check title and content for country mentions
-                content_text = f"{title} {summary} {overview}".lower()
-                
                 # STRICTER COUNTRY MATCHING - Must appear in title or be prominent in content
                 is_relevant = False
                 country_found_in = []
-                
-                # Check if country appears in title (high relevance)
-                title_lower = title.lower()
                 for country_var in country_variations:
                     pattern = r'\b' + re.escape(country_var) + r'\b'
-                    if re.search(pattern, title_lower, re.IGNORECASE):
+                    if re.search(pattern, entry.title_lower):
                         is_relevant = True
                         country_found_in.append(f"title: {country_var}")
                         break
-                
                 # If not in title, check for prominent mentions in content
                 if not is_relevant:
                     for country_var in country_variations:
                         pattern = r'\b' + re.escape(country_var) + r'\b'
-                        matches = re.findall(pattern, content_text, re.IGNORECASE)
+                        matches = re.findall(pattern, entry.content_lower)
                         # Require multiple mentions or specific outbreak keywords
-                        if len(matches) >= 2 or (len(matches) >= 1 and any(keyword in content_text for keyword in ['outbreak in', 'epidemic in', 'cases in', 'reported in'])):
+                        if len(matches) >= 2 or (len(matches) >= 1 and entry.has_outbreak_phrase):
                             is_relevant = True
                             country_found_in.append(f"content: {country_var} ({len(matches)} mentions)")
                             break
-                
                 # Also check regions/countries field if available
+                if not is_relevant and entry.regions_lower:
+                    for country_var in country_variations:
+                        pattern = r'\b' + re.escape(country_var) + r'\b'
+                        if re.search(pattern, entry.regions_lower):
+                            is_relevant = True
+                            country_found_in.append(f"regions: {country_var}")
+                            break
                 if not is_relevant:
-                    regions_content = entry.get('regionscountries', entry.get('RegionsCountries', ''))
-                    if regions_content and isinstance(regions_content, str):
-                        regions_lower = regions_content.lower()
-                        for country_var in country_variations:
-                            pattern = r'\b' + re.escape(country_var) + r'\b'
-                            if re.search(pattern, regions_lower, re.IGNORECASE):
-                                is_relevant = True
-                                country_found_in.append(f"regions: {country_var}")
-                                break
-                
-                # ADDITIONAL VALIDATION - Ensure it's actually about the country, not just mentioning it
-                if is_relevant:
-                    # Skip if it's clearly about a different primary country
-                    other_countries = ['afghanistan', 'albania', 'algeria', 'argentina', 'australia', 'austria', 'bangladesh', 'belgium', 'brazil', 'canada', 'chile', 'colombia', 'denmark', 'egypt', 'ethiopia', 'finland', 'france', 'germany', 'ghana', 'greece', 'india', 'indonesia', 'iran', 'iraq', 'ireland', 'israel', 'italy', 'japan', 'kenya', 'malaysia', 'mexico', 'morocco', 'netherlands', 'nigeria', 'norway', 'pakistan', 'peru', 'philippines', 'poland', 'portugal', 'romania', 'saudi arabia', 'singapore', 'spain', 'sweden', 'switzerland', 'thailand', 'turkey', 'ukraine', 'venezuela', 'vietnam']
-                    
-                    # Remove user's country from the check list
-                    other_countries = [c for c in other_countries if c != user_country_clean and c not in country_variations]
-                    
-                    # Count mentions of other countries in title
-                    other_country_mentions_in_title = 0
-                    for other_country in other_countries:
-                        if re.search(r'\b' + re.escape(other_country) + r'\b', title_lower):
-                            other_country_mentions_in_title += 1
-                    
-                    # If title prominently features other countries, it's probably not about user's country
-                    if other_country_mentions_in_title >= 2:
-                        print(f"🚫 Skipping outbreak primarily about other countries: {title[:50]}...")
-                        continue
-                
-                if is_relevant:
-                    disease_name = title
-                    if ' – ' in title:  # WHO often uses this format: "Disease – Country"
-                        disease_name = title.split(' – ')[0].strip()
-                    elif '-' in title:
-                        disease_name = title.split('-')[0].strip()
-                    elif 'outbreak' in title.lower():
-                        disease_name = title.replace('outbreak', '').replace('Outbreak', '').strip()
-                    
-                    formatted_date = publication_date
-                    if publication_date:
-                        try:
-                            if 'T' in publication_date:
-                                parsed_date = datetime.fromisoformat(publication_date.replace('Z', '+00:00'))
-                                formatted_date = parsed_date.strftime('%Y-%m-%d')
-                        except:
-                            pass
-                    
-                    outbreak_info = {
-                        'disease': disease_name,
-                        'title': title,
-                        'location': user_country,
-                        'date': formatted_date,
-                        'year': outbreak_year,
-                        'summary': (summary or overview)[:300] + '...' if len(summary or overview) > 300 else (summary or overview),
-                        'source': 'WHO Disease Outbreak News',
-                        'relevance_details': ', '.join(country_found_in)
-                    }
-                    relevant_outbreaks.append(outbreak_info)
-                    print(f"✅ Found relevant outbreak: {disease_name} for {user_country} ({outbreak_year}) - Found in: {', '.join(country_found_in)}")
+                    continue
+                # Skip if the title is clearly about other countries, not just mentioning the user's
+                other_country_mentions_in_title = 0
+                for other_country in other_countries:
+                    if re.search(r'\b' + re.escape(other_country) + r'\b', entry.title_lower):
+                        other_country_mentions_in_title += 1
+                if other_country_mentions_in_title >= 2:
+                    log.warning("🚫 Skipping outbreak primarily about other countries: %s...", entry.title[:50])
+                    continue
+                summary_text = entry.summary or entry.overview
+                outbreak_info = {
+                    'disease': entry.disease,
+                    'title': entry.title,
+                    'location': user_country,
+                    'date': entry.formatted_date,
+                    'year': entry.year,
+                    'summary': summary_text[:300] + '...' if len(summary_text) > 300 else summary_text,
+                    'source': 'WHO Disease Outbreak News',
+                    'relevance_details': ', '.join(country_found_in)
+                }
+                relevant_outbreaks.append(outbreak_info)
+                log.info("✅ Found relevant outbreak: %s for %s (%s) - Found in: %s", entry.disease, user_country, entry.year, ', '.join(country_found_in))
             except Exception as e:
-                print(f"⚠️ Error processing outbreak entry: {e}")
+                log.warning("⚠️ Error processing outbreak entry: %s", e)
                 continue
         
-        # Sort by year (most recent first)
-        relevant_outbreaks.sort(key=lambda x: x.get('year', 0), reverse=True)
-        
-        # Limit to most recent 5 outbreaks to avoid overwhelming users
-        relevant_outbreaks = relevant_outbreaks[:5]
-        
-        print(f"🎯 Found {len(relevant_outbreaks)} recent and relevant outbreaks for {user_country}")
+        log.info("🎯 Found %s recent and relevant outbreaks for %s", len(relevant_outbreaks), user_country)
+        _country_outbreaks_cache[country_key] = (_who_cache["expires"], relevant_outbreaks)
         return relevant_outbreaks
-    except Exception as e:
-        print(f"💥 Error processing WHO outbreak data: {e}")
+    except Exception:
+        log.exception("💥 Error processing WHO outbreak data")
         return []
 def initialize_endlessmedical():
     """DEPRECATED - Use set_endlessmedical_features instead"""
-    print("⚠️ WARNING: initialize_endlessmedical is deprecated. Use RapidAPI functions instead.")
+    log.warning("⚠️ WARNING: initialize_endlessmedical is deprecated. Use RapidAPI functions instead.")
     return False
+# One pass over the symptom text; each named group maps to an EndlessMedical feature
+_SYMPTOM_RE = re.compile(r'(?P<headache>headache)|(?P<fever>fever)|(?P<fatigue>tired|fatigue)|(?P<nausea>nausea)|(?P<hand>hand)|(?P<pain>hurt|pain)', re.IGNORECASE)
 def get_endlessmedical_diagnosis(symptoms_text, user_profile):
     """DEPRECATED - Use set_endlessmedical_features + analyze_endlessmedical_session instead"""
-    print("⚠️ WARNING: get_endlessmedical_diagnosis is deprecated. Using RapidAPI functions instead.")
+    log.warning("⚠️ WARNING: get_endlessmedical_diagnosis is deprecated. Using RapidAPI functions instead.")
     try:
         features = {}
-        symptoms_lower = symptoms_text.lower()
-        if user_profile and user_profile.get('age'):
-            features['Age'] = str(user_profile.get('age'))
+        matches = {m.lastgroup for m in _SYMPTOM_RE.finditer(symptoms_text)}
+        if user_profile and user_profile.age:
+            features['Age'] = str(user_profile.age)
         else:
             features['Age'] = '30'
-        if 'headache' in symptoms_lower:
+        if 'headache' in matches:
             features['HeadacheFrontal'] = '1'
-        if 'fever' in symptoms_lower:
+        if 'fever' in matches:
             features['Temp'] = '38.5'
-        if 'tired' in symptoms_lower or 'fatigue' in symptoms_lower:
+        if 'fatigue' in matches:
             features['GeneralizedFatigue'] = '1'
-        if 'nausea' in symptoms_lower:
+        if 'nausea' in matches:
             features['Nausea'] = '1'
-        if 'hand' in symptoms_lower and ('hurt' in symptoms_lower or 'pain' in symptoms_lower):
+        if 'hand' in matches and 'pain' in matches:
             features['JointsPain'] = '1'
             features['MuscleGenPain'] = '1'
         set_result = set_endlessmedical_features(features)
         if set_result.get('status') == 'success':
-            return analyze_endlessmedical_session()
+            return analyze_endlessmedical_session(set_result['session_id'])
         else:
             return None
-    except Exception as e:
-        print(f"Error in deprecated function redirect: {e}")
+    except Exception:
+        log.exception("Error in deprecated function redirect")
         return None
+def _update_endlessmedical_feature(base_url, session_id, headers, feature_name, feature_value):
+    """Set one feature on an EndlessMedical session; returns (was_set, summary entry)"""
+    try:
+        log.info("🔧 Setting %s = %s", feature_name, feature_value)
+        response = _clinical_api_session.post(
+            f"{base_url}/UpdateFeature",
+            params={'SessionID': session_id, 'name': feature_name, 'value': str(feature_value)},
+            headers=headers,
+            timeout=10
+        )
+        if response.status_code == 200:
+            try:
+                response_data = orjson.loads(response.content)
+                if response_data.get('status') == 'ok':
+                    log.info("✅ Set %s = %s", feature_name, feature_value)
+                    return True, f"{feature_name}={feature_value}"
+                log.error("❌ Failed to set %s: %s", feature_name, response_data)
+                return False, f"{feature_name}: {response_data}"
+            except ValueError:
+                if "ok" in response.text.lower():
+                    log.info("✅ Set %s = %s", feature_name, feature_value)
+                    return True, f"{feature_name}={feature_value}"
+                log.error("❌ Failed to set %s: Invalid response", feature_name)
+                return False, f"{feature_name}: Invalid response"
+        log.error("❌ Failed to set %s: HTTP %s", feature_name, response.status_code)
+        return False, f"{feature_name}: HTTP {response.status_code}"
+    except Exception as e:
+        log.exception("❌ Error setting %s", feature_name)
+        return False, f"{feature_name}: {str(e)}"
 def set_endlessmedical_features(features_dict):
     """
-    Set medical features in EndlessMedical session via RapidAPI (secure)
-    This allows the LLM to specify exactly which features to set
+    Set medical features in a new EndlessMedical session via RapidAPI (secure)
+    This allows the LLM to specify exactly which features to set; the returned
+    session_id must be passed to analyze_endlessmedical_session
     """
-    global _endlessmedical_session
+    global _endlessmedical_base_url
     try:
         rapidapi_key = current_app.config.get('RAPIDAPI_KEY')
         if not rapidapi_key:
-            print("❌ RAPIDAPI_KEY not found in configuration")
+            log.error("❌ RAPIDAPI_KEY not found in configuration")
             return {
                 "status": "error", 
                 "error": "RAPIDAPI_KEY not found in configuration",
                 "details": "Please set RAPIDAPI_KEY environment variable"
             }
-        rapidapi_host = "endlessmedicalapi1.p.rapidapi.com"
+        rapidapi_host = current_app.config.get('RAPIDAPI_HOST')
         possible_base_urls = [
             f"https://{rapidapi_host}",
             f"https://{rapidapi_host}/v1/dx", 
-            f"https://api.endlessmedical.com/v1/dx"
+            current_app.config.get('ENDLESSMEDICAL_API_URL')
         ]
+        if _endlessmedical_base_url in possible_base_urls:
+            possible_base_urls.remove(_endlessmedical_base_url)
+            possible_base_urls.insert(0, _endlessmedical_base_url)
         headers = {
             "X-RapidAPI-Key": rapidapi_key,
             "X-RapidAPI-Host": rapidapi_host,
             "Content-Type": "application/json"
         }
-        print(f"🔑 Using RapidAPI Key: {rapidapi_key[:10]}...{rapidapi_key[-4:]}")
-        print(f"🔧 Setting {len(features_dict)} medical features...")
-        if not _endlessmedical_session["initialized"]:
-            print("🔄 Initializing EndlessMedical session...")
-            session_id = None
-            working_base_url = None
-            for base_url in possible_base_urls:
-                print(f"🌐 Trying: {base_url}/InitSession")
-                try:
-                    session_response = requests.get(f"{base_url}/InitSession", headers=headers, timeout=10)
-                    print(f"📡 Response: {session_response.status_code}")
-                    if session_response.status_code == 403:
-                        print(f"❌ 403 Forbidden - Subscription required or quota exceeded")
-                        return {
-                            "status": "error", 
-                            "error": "RapidAPI subscription required. Please subscribe to EndlessMedical API on RapidAPI platform.",
-                            "details": "Visit https://rapidapi.com/lukaszkiljanek/api/endlessmedicalapi1 to subscribe",
-                            "subscription_url": "https://rapidapi.com/lukaszkiljanek/api/endlessmedicalapi1"
-                        }
-                    elif session_response.status_code == 401:
-                        print(f"❌ 401 Unauthorized - Invalid API key")
-                        return {
-                            "status": "error", 
-                            "error": "Invalid RapidAPI key. Please check your RAPIDAPI_KEY in environment variables.",
-                            "details": "Get a valid key from https://rapidapi.com/",
-                            "rapidapi_url": "https://rapidapi.com/"
-                        }
-                    elif session_response.status_code == 404:
-                        print(f"❌ 404 Not Found - Endpoint structure incorrect")
-                        continue
-                    elif session_response.status_code == 200:
-                        print(f"✅ Found working endpoint: {base_url}")
-                        working_base_url = base_url
-                        try:
-                            session_data = session_response.json()
-                            print(f"📊 Session data: {session_data}")
-                            if session_data.get('status') == 'ok':
-                                session_id = session_data.get('SessionID')
-                                if session_id:
-                                    print(f"✅ Session ID received: {session_id}")
-                                    break
-                                else:
-                                    print(f"❌ No session ID in response: {session_data}")
+        log.debug("🔑 Using RapidAPI Key: %s...%s", rapidapi_key[:10], rapidapi_key[-4:])
+        log.info("🔧 Setting %s medical features...", len(features_dict))
+        log.info("🔄 Initializing EndlessMedical session...")
+        session_id = None
+        working_base_url = None
+        for base_url in possible_base_urls:
+            log.info("🌐 Trying: %s/InitSession", base_url)
+            try:
+                session_response = _clinical_api_session.get(f"{base_url}/InitSession", headers=headers, timeout=10)
+                log.info("📡 Response: %s", session_response.status_code)
+                if session_response.status_code == 403:
+                    log.error("❌ 403 Forbidden - Subscription required or quota exceeded")
+                    return {
+                        "status": "error", 
+                        "error": "RapidAPI subscription required. Please subscribe to EndlessMedical API on RapidAPI platform.",
+                        "details": "Visit https://rapidapi.com/lukaszkiljanek/api/endlessmedicalapi1 to subscribe",
+                        "subscription_url": "https://rapidapi.com/lukaszkiljanek/api/endlessmedicalapi1"
+                    }
+                elif session_response.status_code == 401:
+                    log.error("❌ 401 Unauthorized - Invalid API key")
+                    return {
+                        "status": "error", 
+                        "error": "Invalid RapidAPI key. Please check your RAPIDAPI_KEY in environment variables.",
+                        "details": "Get a valid key from https://rapidapi.com/",
+                        "rapidapi_url": "https://rapidapi.com/"
+                    }
+                elif session_response.status_code == 404:
+                    log.error("❌ 404 Not Found - Endpoint structure incorrect")
+                    continue
+                elif session_response.status_code == 200:
+                    log.info("✅ Found working endpoint: %s", base_url)
+                    working_base_url = base_url
+                    try:
+                        session_data = orjson.loads(session_response.content)
+                        log.info("📊 Session data: %s", session_data)
+                        if session_data.get('status') == 'ok':
+                            session_id = session_data.get('SessionID')
+                            if session_id:
+                                log.info("✅ Session ID received: %s", session_id)
+                                break
                             else:
-                                print(f"❌ Session init failed: {session_data}")
-                        except ValueError as e:
-                            print(f"❌ JSON parsing error: {e}")
-                            print(f"Raw response: {session_response.text[:200]}")
-                            continue
-                    else:
-                        print(f"⚠️ Unexpected status {session_response.status_code}: {session_response.text[:100]}")
+                                log.error("❌ No session ID in response: %s", session_data)
+                        else:
+                            log.error("❌ Session init failed: %s", session_data)
+                    except ValueError as e:
+                        log.error("❌ JSON parsing error: %s", e)
+                        if log.isEnabledFor(logging.DEBUG):
+                            log.debug("Raw response: %s", session_response.text[:200])
                         continue
-                except requests.exceptions.Timeout:
-                    print(f"⏱️ Timeout for {base_url}")
-                    continue
-                except requests.exceptions.ConnectionError:
-                    print(f"🌐 Connection error for {base_url}")
-                    continue
-                except Exception as e:
-                    print(f"💥 Error with {base_url}: {e}")
+                else:
+                    log.warning("⚠️ Unexpected status %s: %s", session_response.status_code, session_response.text[:100])
                     continue
-            if not working_base_url or not session_id:
-                print("❌ All EndlessMedical API endpoints failed")
-                return {
-                    "status": "error",
-                    "error": "EndlessMedical API is currently unavailable",
-                    "details": "All API endpoints returned errors. This may be due to:",
-                    "possible_causes": [
-                        "API structure has changed",
-                        "RapidAPI subscription is not active",
-                        "Service is temporarily down",
-                        "API key is invalid or expired"
-                    ],
-                    "troubleshooting": {
-                        "check_subscription": "https://rapidapi.com/lukaszkiljanek/api/endlessmedicalapi1",
-                        "verify_api_key": "Check RAPIDAPI_KEY environment variable",
-                        "contact_support": "Contact RapidAPI or EndlessMedical support"
-                    }
+            except requests.exceptions.Timeout:
+                log.warning("⏱️ Timeout for %s", base_url)
+                continue
+            except requests.exceptions.ConnectionError:
+                log.warning("🌐 Connection error for %s", base_url)
+                continue
+            except Exception:
+                log.exception("💥 Error with %s", base_url)
+                continue
+        if not working_base_url or not session_id:
+            log.error("❌ All EndlessMedical API endpoints failed")
+            return {
+                "status": "error",
+                "error": "EndlessMedical API is currently unavailable",
+                "details": "All API endpoints returned errors. This may be due to:",
+                "possible_causes": [
+                    "API structure has changed",
+                    "RapidAPI subscription is not active",
+                    "Service is temporarily down",
+                    "API key is invalid or expired"
+                ],
+                "troubleshooting": {
+                    "check_subscription": "https://rapidapi.com/lukaszkiljanek/api/endlessmedicalapi1",
+                    "verify_api_key": "Check RAPIDAPI_KEY environment variable",
+                    "contact_support": "Contact RapidAPI or EndlessMedical support"
                 }
-            terms_passphrase = "I have read, understood and I accept and agree to comply with the Terms of Use of EndlessMedicalAPI and Endless Medical services. The Terms of Use are available on endlessmedical.com"
-            print("📝 Accepting terms of use...")
-            try:
-                terms_response = requests.post(
-                    f"{working_base_url}/AcceptTermsOfUse",
-                    params={'SessionID': session_id, 'passphrase': terms_passphrase},
-                    headers=headers,
-                    timeout=10
-                )
-                print(f"📡 Terms response: {terms_response.status_code}")
-                if terms_response.status_code == 200:
-                    terms_data = terms_response.json()
-                    if terms_data.get('status') == 'ok':
-                        _endlessmedical_session["session_id"] = session_id
-                        _endlessmedical_session["initialized"] = True
-                        _endlessmedical_session["base_url"] = working_base_url
-                        print(f"✅ EndlessMedical session initialized: {session_id}")
-                    else:
-                        print(f"❌ Terms acceptance failed: {terms_data}")
-                        return {
-                            "status": "error", 
-                            "error": "Failed to accept terms of use",
-                            "details": str(terms_data)
-                        }
+            }
+        terms_passphrase = "I have read, understood and I accept and agree to comply with the Terms of Use of EndlessMedicalAPI and Endless Medical services. The Terms of Use are available on endlessmedical.com"
+        log.info("📝 Accepting terms of use...")
+        try:
+            terms_response = _clinical_api_session.post(
+                f"{working_base_url}/AcceptTermsOfUse",
+                params={'SessionID': session_id, 'passphrase': terms_passphrase},
+                headers=headers,
+                timeout=10
+            )
+            log.info("📡 Terms response: %s", terms_response.status_code)
+            if terms_response.status_code == 200:
+                terms_data = orjson.loads(terms_response.content)
+                if terms_data.get('status') == 'ok':
+                    _endlessmedical_base_url = working_base_url
+                    log.info("✅ EndlessMedical session initialized: %s", session_id)
                 else:
-                    print(f"❌ Terms acceptance HTTP error: {terms_response.status_code}")
+                    log.error("❌ Terms acceptance failed: %s", terms_data)
                     return {
                         "status": "error", 
-                        "error": f"Failed to accept terms: HTTP {terms_response.status_code}",
-                        "details": terms_response.text[:200]
+                        "error": "Failed to accept terms of use",
+                        "details": str(terms_data)
                     }
-            except Exception as e:
-                print(f"💥 Terms acceptance error: {e}")
+            else:
+                log.error("❌ Terms acceptance HTTP error: %s", terms_response.status_code)
                 return {
                     "status": "error", 
-                    "error": f"Error accepting terms: {str(e)}",
-                    "details": "Network or API error during terms acceptance"
+                    "error": f"Failed to accept terms: HTTP {terms_response.status_code}",
+                    "details": terms_response.text[:200]
                 }
-        session_id = _endlessmedical_session["session_id"]
-        base_url = _endlessmedical_session.get("base_url", possible_base_urls[0])
+        except Exception as e:
+            log.exception("💥 Terms acceptance error")
+            return {
+                "status": "error", 
+                "error": f"Error accepting terms: {str(e)}",
+                "details": "Network or API error during terms acceptance"
+            }
+        base_url = working_base_url
         features_set = []
         failed_features = []
-        print(f"🔧 Setting {len(features_dict)} features using session {session_id}")
-        for feature_name, feature_value in features_dict.items():
-            try:
-                print(f"🔧 Setting {feature_name} = {feature_value}")
-                response = requests.post(
-                    f"{base_url}/UpdateFeature",
-                    params={'SessionID': session_id, 'name': feature_name, 'value': str(feature_value)},
-                    headers=headers,
-                    timeout=10
-                )
-                if response.status_code == 200:
-                    try:
-                        response_data = response.json()
-                        if response_data.get('status') == 'ok':
-                            features_set.append(f"{feature_name}={feature_value}")
-                            print(f"✅ Set {feature_name} = {feature_value}")
-                        else:
-                            failed_features.append(f"{feature_name}: {response_data}")
-                            print(f"❌ Failed to set {feature_name}: {response_data}")
-                    except ValueError:
-                        if "ok" in response.text.lower():
-                            features_set.append(f"{feature_name}={feature_value}")
-                            print(f"✅ Set {feature_name} = {feature_value}")
-                        else:
-                            failed_features.append(f"{feature_name}: Invalid response")
-                            print(f"❌ Failed to set {feature_name}: Invalid response")
-                else:
-                    failed_features.append(f"{feature_name}: HTTP {response.status_code}")
-                    print(f"❌ Failed to set {feature_name}: HTTP {response.status_code}")
-            except Exception as e:
-                failed_features.append(f"{feature_name}: {str(e)}")
-                print(f"❌ Error setting {feature_name}: {e}")
+        log.info("🔧 Setting %s features using session %s", len(features_dict), session_id)
+        update_results = _endlessmedical_feature_executor.map(
+            lambda item: _update_endlessmedical_feature(base_url, session_id, headers, *item),
+            features_dict.items()
+        )
+        for was_set, entry in update_results:
+            (features_set if was_set else failed_features).append(entry)
         if features_set:
             result = {
                 "status": "success",
@@ -664,7 +893,7 @@ def set_endlessmedical_features(features_dict):
                 "total_features": len(features_set),
                 "success_rate": f"{len(features_set)}/{len(features_dict)} features set successfully"
             }
-            print(f"✅ Features set successfully: {len(features_set)}/{len(features_dict)}")
+            log.info("✅ Features set successfully: %s/%s", len(features_set), len(features_dict))
             return result
         else:
             return {
@@ -675,21 +904,20 @@ def set_endlessmedical_features(features_dict):
                 "troubleshooting": "Check feature names and values against EndlessMedical API documentation"
             }
     except Exception as e:
-        print(f"💥 Unexpected error in set_endlessmedical_features: {e}")
+        log.exception("💥 Unexpected error in set_endlessmedical_features")
         return {
             "status": "error", 
             "error": f"Unexpected error: {str(e)}",
             "details": "An unexpected error occurred while setting medical features"
         }
-def analyze_endlessmedical_session():
+def analyze_endlessmedical_session(session_id):
     """
-    Analyze the current EndlessMedical session via RapidAPI (secure)
-    Should be called after set_endlessmedical_features
+    Analyze an EndlessMedical session via RapidAPI (secure)
+    Should be called with the session_id returned by set_endlessmedical_features
     """
-    global _endlessmedical_session
     try:
-        if not _endlessmedical_session["initialized"] or not _endlessmedical_session["session_id"]:
-            print("❌ No active EndlessMedical session")
+        if not session_id:
+            log.error("❌ No active EndlessMedical session")
             return {
                 "status": "error", 
                 "error": "No active session. Call set_medical_features first.",
@@ -702,23 +930,22 @@ def analyze_endlessmedical_session():
                 "error": "RAPIDAPI_KEY not found in configuration",
                 "details": "Please set RAPIDAPI_KEY environment variable"
             }
-        rapidapi_host = "endlessmedicalapi1.p.rapidapi.com"
-        base_url = _endlessmedical_session.get("base_url", f"https://{rapidapi_host}")
+        rapidapi_host = current_app.config.get('RAPIDAPI_HOST')
+        base_url = _endlessmedical_base_url or f"https://{rapidapi_host}"
         headers = {
             "X-RapidAPI-Key": rapidapi_key,
             "X-RapidAPI-Host": rapidapi_host,
             "Content-Type": "application/json"
         }
-        session_id = _endlessmedical_session["session_id"]
-        print(f"🔍 Analyzing EndlessMedical session: {session_id}")
+        log.info("🔍 Analyzing EndlessMedical session: %s", session_id)
         try:
-            analyze_response = requests.get(
+            analyze_response = _clinical_api_session.get(
                 f"{base_url}/Analyze",
                 params={'SessionID': session_id},
                 headers=headers,
                 timeout=15
             )
-            print(f"📡 Analysis response: {analyze_response.status_code}")
+            log.info("📡 Analysis response: %s", analyze_response.status_code)
             if analyze_response.status_code == 403:
                 return {
                     "status": "error",
@@ -740,8 +967,8 @@ def analyze_endlessmedical_session():
                 }
             elif analyze_response.status_code == 200:
                 try:
-                    analyze_data = analyze_response.json()
-                    print(f"📊 Analysis data: {analyze_data}")
+                    analyze_data = orjson.loads(analyze_response.content)
+                    log.info("📊 Analysis data: %s", analyze_data)
                     if analyze_data.get('status') == 'ok':
                         diseases = analyze_data.get('Diseases', [])
                         if diseases:
@@ -753,9 +980,7 @@ def analyze_endlessmedical_session():
                                         'probability': float(probability),
                                         'common_name': disease_name
                                     })
-                            print(f"✅ EndlessMedical analysis complete: {len(conditions)} conditions found")
-                            _endlessmedical_session["initialized"] = False
-                            _endlessmedical_session["session_id"] = None
+                            log.info("✅ EndlessMedical analysis complete: %s conditions found", len(conditions))
                             return {
                                 'conditions': conditions,
                                 'status': 'success',
@@ -764,7 +989,7 @@ def analyze_endlessmedical_session():
                                 'database': 'EndlessMedical (830+ medical conditions)'
                             }
                         else:
-                            print("ℹ️ EndlessMedical analysis completed but no diseases found")
+                            log.info("ℹ️ EndlessMedical analysis completed but no diseases found")
                             return {
                                 'status': 'no_results',
                                 'message': 'No specific conditions found in clinical database',
@@ -772,7 +997,7 @@ def analyze_endlessmedical_session():
                                 'suggestion': 'Try setting more specific medical features'
                             }
                     else:
-                        print(f"❌ Analysis failed: {analyze_data}")
+                        log.error("❌ Analysis failed: %s", analyze_data)
                         return {
                             'status': 'error',
                             'error': 'Analysis failed',
@@ -780,14 +1005,14 @@ def analyze_endlessmedical_session():
                             'suggestion': 'Check if all required features were set correctly'
                         }
                 except ValueError as e:
-                    print(f"❌ JSON parsing error in analysis: {e}")
+                    log.error("❌ JSON parsing error in analysis: %s", e)
                     return {
                         'status': 'error',
                         'error': 'Invalid response format from analysis',
                         'details': f'JSON parsing failed: {str(e)}'
                     }
             else:
-                print(f"⚠️ Unexpected analysis status: {analyze_response.status_code}")
+                log.warning("⚠️ Unexpected analysis status: %s", analyze_response.status_code)
                 return {
                     'status': 'error',
                     'error': f'Analysis request failed: HTTP {analyze_response.status_code}',
@@ -795,28 +1020,28 @@ def analyze_endlessmedical_session():
                     'suggestion': 'Check API status and try again'
                 }
         except requests.exceptions.Timeout:
-            print("⏱️ Analysis request timed out")
+            log.warning("⏱️ Analysis request timed out")
             return {
                 'status': 'error',
                 'error': 'Analysis request timed out',
                 'details': 'The analysis took too long to complete'
             }
         except requests.exceptions.ConnectionError:
-            print("🌐 Connection error during analysis")
+            log.warning("🌐 Connection error during analysis")
             return {
                 'status': 'error',
                 'error': 'Network connection error during analysis',
                 'details': 'Check internet connection and API status'
             }
         except Exception as e:
-            print(f"💥 Analysis error: {e}")
+            log.exception("💥 Analysis error")
             return {
                 'status': 'error',
                 'error': f'Analysis failed: {str(e)}',
                 'details': 'An unexpected error occurred during analysis'
             }
     except Exception as e:
-        print(f"💥 Unexpected error in analyze_endlessmedical_session: {e}")
+        log.exception("💥 Unexpected error in analyze_endlessmedical_session")
         return {
             'status': 'error',
             'error': f'Unexpected error: {str(e)}',
@@ -2,7 +2,7 @@
 import time
 import threading
 from datetime import datetime, timedelta
-from models.user import get_pending_followups, mark_followup_sent, save_followup_response
+from models.user import claim_due_followups, release_followups, save_followup_response
 from services.message_service import send_whatsapp_message, send_telegram_message
 
 class FollowUpService:
@@ -14,12 +14,11 @@ class FollowUpService:
         self._lock = threading.Lock()  # Thread safety
 
     def _clean_recent_sent(self):
-        """Clean recently sent tracking older than 1 hour"""
+        """Clean recently sent tracking older than 1 hour; caller must hold self._lock"""
         cutoff = datetime.now() - timedelta(hours=1)
-        with self._lock:
-            to_remove = [key for key, timestamp in self.recently_sent.items() if timestamp < cutoff]
-            for key in to_remove:
-                del self.recently_sent[key]
+        to_remove = [key for key, timestamp in self.recently_sent.items() if timestamp < cutoff]
+        for key in to_remove:
+            del self.recently_sent[key]
 
     def _is_recently_sent(self, followup_id):
         """Check if followup was recently sent"""
@@ -55,7 +54,8 @@ class FollowUpService:
     def _process_pending_followups(self):
         """Process all pending follow-up reminders"""
         try:
-            pending_followups = get_pending_followups()
+            pending_followups = claim_due_followups()
+            failed_ids = []
             for followup in pending_followups:
                 followup_id, user_id, platform, symptoms, diagnosis_id, scheduled_time = followup
                 if self._is_recently_sent(followup_id):
@@ -67,11 +67,12 @@ class FollowUpService:
                 elif platform == "telegram":
                     success = send_telegram_message(user_id, followup_message)
                 if success:
-                    mark_followup_sent(followup_id)
                     self._mark_recently_sent(followup_id)
                     print(f"✅ Follow-up sent to {user_id} on {platform}")
                 else:
+                    failed_ids.append(followup_id)
                     print(f"❌ Failed to send follow-up to {user_id} on {platform}")
+            release_followups(failed_ids)
         except Exception as e:
             print(f"Error processing follow-ups: {e}")
     def _create_followup_message(self, original_symptoms):
@@ -16,6 +16,7 @@ from pydantic import SecretStr
 from flask import current_app
 from services.medical_tools import MEDICAL_TOOLS
 from utils.constants import MEDICAL_AGENT_SYSTEM_PROMPT
+from utils.helpers import image_content_block
 
 class MedicalAgentState(TypedDict):
     """
@@ -58,6 +59,7 @@ class MedicalAgentSystem:
             model="gemini-2.5-flash",
             google_api_key=SecretStr(api_key),
             temperature=0.3,
+            max_output_tokens=current_app.config.get('GEMINI_MAX_OUTPUT_TOKENS'),
             convert_system_message_to_human=False
         ).bind_tools(self.tools)
 
@@ -73,7 +75,7 @@ class MedicalAgentSystem:
                 return "tools"
             return "respond"
 
-        def medical_agent_node(state: MedicalAgentState) -> Dict[str, Any]:
+        async def medical_agent_node(state: MedicalAgentState) -> Dict[str, Any]:
             """Main agent node - orchestrates medical analysis"""
             messages = state["messages"]
             user_id = state["user_id"]
@@ -81,7 +83,7 @@ class MedicalAgentSystem:
             system_context = self._build_system_context(state)
             if not messages or not isinstance(messages[0], SystemMessage):
                 messages = [SystemMessage(content=system_context)] + messages
-            response = self.llm.invoke(messages)
+            response = await self.llm.ainvoke(messages)
             return {
                 "messages": [response],
                 "analysis_metadata": {
@@ -204,12 +206,7 @@ class MedicalAgentSystem:
             image_message = HumanMessage(
                 content=[
                     {"type": "text", "text": message},
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{image_data.decode() if isinstance(image_data, bytes) else image_data}"
-                        }
-                    }
+                    image_content_block(image_data.decode() if isinstance(image_data, bytes) else image_data)
                 ]
             )
             initial_state["messages"] = [image_message]
@@ -4,9 +4,102 @@ from langchain_core.messages import HumanMessage
 from pydantic import SecretStr
 from flask import current_app
 import re
-from models.user import get_user_profile, get_user_history, save_diagnosis_to_history, get_user_country
-from utils.helpers import format_medical_history_for_analysis, format_profile_for_analysis, detect_platform
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from models.user import get_user_profile, get_profile_text, get_user_history, save_diagnosis_to_history, get_user_country
+from utils.helpers import format_medical_history_for_analysis, detect_platform, image_content_block
 from services.external_apis import check_disease_outbreaks_for_user, get_endlessmedical_diagnosis
+from utils.constants import INVALID_SYMPTOMS_MSG
+from utils.logger import get_logger
+log = get_logger(__name__)
+# Static prompt fragments; per-request text is spliced in with str.join
+_COMBINED_PROMPT_HEAD = """You are a medical AI assistant. Based on the symptoms, image, profile, and medical history provided, provide a structured preliminary diagnosis.
+CURRENT SYMPTOMS: """
+_COMBINED_PROMPT_TAIL = """
+CRITICAL: Detect the language of the user's symptoms text and respond in EXACTLY the same language. If the user wrote in Spanish, respond in Spanish. If they wrote in French, respond in French, etc.
+IMPORTANT: Consider the user's age and gender when providing analysis.
+Provide a structured response in this EXACT order:
+1. **Most Likely Diagnoses** (Top 2 most probable conditions based on all available information)
+2. **Home Remedies** (2-3 safe, simple remedies they can try at home)
+3. **Possible Causes** (What might be causing these symptoms considering age/gender/history)
+4. **Medical Urgency** (Whether they should visit a clinic and how urgent it is)
+Be thorough but concise. This is meant to be a preliminary diagnosis using whatever information is available.
+End with a medical disclaimer appropriate for the detected language (equivalent to: "I am an AI health assistant, not a doctor. Seek medical help for more accurate diagnoses.")"""
+_TEXT_PROMPT_HEAD = """You are a medical AI assistant. Based on the symptoms and profile provided, provide a structured preliminary diagnosis.
+USER SYMPTOMS: """
+_TEXT_PROMPT_PROFILE = '\nUser Profile Information:'
+_TEXT_PROMPT_TAIL = """
+CRITICAL: Detect the language of the user's symptoms text and respond in EXACTLY the same language. If the user wrote in Spanish, respond in Spanish. If they wrote in French, respond in French, etc.
+IMPORTANT: Consider the user's age and gender in your analysis.
+Provide a structured response in this EXACT order:
+1. **Most Likely Diagnoses** (Top 2 most probable conditions based on symptoms and profile)
+2. **Home Remedies** (2-3 safe, simple remedies they can try at home)
+3. **Possible Causes** (What might be causing these symptoms considering age/gender)
+4. **Medical Urgency** (Whether they should visit a clinic and how urgent it is)
+Be thorough but concise. This is meant to be a preliminary diagnosis using whatever information is available.
+End with a medical disclaimer appropriate for the detected language (equivalent to: "I am an AI health assistant, not a doctor. Seek medical help for more accurate diagnoses.")"""
+_IMAGE_PROMPT_HEAD = """Based on this medical image and profile, provide a structured preliminary diagnosis.
+User Profile Information:"""
+_IMAGE_PROMPT_TAIL = """
+CRITICAL: Since this is an image-only analysis, respond in English by default. However, if there are any text elements in the image that indicate a different language preference, respond in that language instead.
+IMPORTANT: Consider the user's age and gender when analyzing the image.
+Provide a structured response in this EXACT order:
+1. **Most Likely Diagnoses** (Top 2 most probable conditions based on visual analysis and profile)
+2. **Home Remedies** (2-3 safe, simple remedies they can try at home)
+3. **Possible Causes** (What might be causing what you see in the image)
+4. **Medical Urgency** (Whether they should visit a clinic and how urgent it is)
+Be thorough but concise. This is meant to be a preliminary diagnosis using whatever information is available.
+End with a medical disclaimer appropriate for the language (equivalent to: "I am an AI health assistant, not a doctor. Seek medical help for more accurate diagnoses.")"""
+_VALIDATION_UNAVAILABLE = ("\n\n**🔬 Medical Database Validation:**\n"
+                           "EndlessMedical clinical database processed your symptoms through diagnostic algorithms covering 830+ medical conditions. "
+                           "This preliminary assessment aligns with documented clinical patterns, providing additional confidence in the analysis.")
+_VALIDATION_NO_MATCH = ("\n\n**🔬 Medical Database Validation:**\n"
+                        "EndlessMedical diagnostic engine analyzed your specific symptom constellation but found no exact database matches. "
+                        "This suggests either a rare condition or early-stage presentation requiring clinical evaluation.")
+_VALIDATION_MATCH_TMPL = "\n\n**🔬 Medical Database Validation:**\nEndlessMedical clinical algorithm processed your specific symptom profile with %s%% probability matching '%s' in their diagnostic database of 830+ conditions."
+_VALIDATION_HIGH = " High-confidence match indicates strong diagnostic correlation with documented clinical presentations."
+_VALIDATION_MODERATE = " Moderate-confidence match suggests probable diagnostic alignment with medical literature."
+_VALIDATION_LOW = " Lower-confidence match indicates possible diagnostic consideration requiring further evaluation."
+_VALIDATION_DIFFERENTIAL_TMPL = "\nDifferential diagnosis also considered: %s based on symptom overlap analysis."
+# Recent analyses keyed by user and input hash, so a double-sent message is not re-analyzed
+_RECENT_RESULT_TTL = 30
+_RECENT_RESULT_SIZE = 256
+_recent_results = OrderedDict()
+_recent_results_lock = threading.Lock()
+def _recent_result_key(user_id, *inputs):
+    """Key a user's analysis by a digest of its inputs"""
+    digest = hashlib.sha1()
+    for value in inputs:
+        digest.update(value.encode())
+    return (user_id, digest.hexdigest())
+def _get_recent_result(key):
+    """Return an analysis produced for the same input within the last few seconds"""
+    with _recent_results_lock:
+        cached = _recent_results.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        return None
+def _remember_result(key, result):
+    """Keep an analysis briefly for duplicate sends"""
+    with _recent_results_lock:
+        _recent_results[key] = (time.monotonic() + _RECENT_RESULT_TTL, result)
+        _recent_results.move_to_end(key)
+        if len(_recent_results) > _RECENT_RESULT_SIZE:
+            _recent_results.popitem(last=False)
+def _is_valid_symptom_text(symptom_text):
+    """Reject empty or trivially short symptom descriptions before any API call"""
+    return bool(symptom_text) and len(symptom_text.strip()) >= 3
+_endlessmedical_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="endlessmedical")
+def _submit_endlessmedical_diagnosis(symptom_text, user_profile):
+    """Start an EndlessMedical lookup in the background under the caller's app context"""
+    app = current_app._get_current_object()
+    def run():
+        with app.app_context():
+            return get_endlessmedical_diagnosis(symptom_text, user_profile)
+    return _endlessmedical_executor.submit(run)
 class MedicalAnalysisService:
     """Service for medical analysis using Gemini AI"""
     def __init__(self):
@@ -46,8 +139,8 @@ class MedicalAnalysisService:
             processed_response = processed_response.strip()
             processed_response = re.sub(r'\*\*(.*?)\*\*', r'**\1**', processed_response)
             return processed_response
-        except Exception as e:
-            print(f"Error post-processing response: {e}")
+        except Exception:
+            log.exception("Error post-processing response")
             return response
     def generate_language_aware_response(self, user_text, response_template):
         """Use Gemini to generate a response in the same language as user input"""
@@ -60,148 +153,111 @@ Keep the same meaning but translate to match the user's language.
 Only return the translated response, nothing else."""
             result = self.llm.invoke(prompt)
             return result.content if isinstance(result.content, str) else str(result.content)
-        except Exception as e:
-            print(f"Language detection error: {e}")
+        except Exception:
+            log.exception("Language detection error")
             return response_template
     def _add_endlessmedical_validation(self, response, endlessmedical_result):
         """Add EndlessMedical validation section to response"""
         if not endlessmedical_result or endlessmedical_result.get('status') != 'success':
-            validation_text = ("\n\n**🔬 Medical Database Validation:**\n"
-                             "EndlessMedical clinical database processed your symptoms through diagnostic algorithms covering 830+ medical conditions. "
-                             "This preliminary assessment aligns with documented clinical patterns, providing additional confidence in the analysis.")
-            return validation_text
+            return _VALIDATION_UNAVAILABLE
         conditions = endlessmedical_result.get('conditions', [])
         if not conditions:
-            validation_text = ("\n\n**🔬 Medical Database Validation:**\n"
-                             "EndlessMedical diagnostic engine analyzed your specific symptom constellation but found no exact database matches. "
-                             "This suggests either a rare condition or early-stage presentation requiring clinical evaluation.")
-            return validation_text
+            return _VALIDATION_NO_MATCH
         top_condition = conditions[0]
         confidence = round(top_condition.get('probability', 0) * 100, 1)
         condition_name = top_condition.get('common_name', top_condition.get('name', 'Unknown'))
-        validation_text = f"\n\n**🔬 Medical Database Validation:**\nEndlessMedical clinical algorithm processed your specific symptom profile with {confidence}% probability matching '{condition_name}' in their diagnostic database of 830+ conditions."
         if confidence > 80:
-            validation_text += " High-confidence match indicates strong diagnostic correlation with documented clinical presentations."
+            strength = _VALIDATION_HIGH
         elif confidence > 60:
-            validation_text += " Moderate-confidence match suggests probable diagnostic alignment with medical literature."
+            strength = _VALIDATION_MODERATE
         else:
-            validation_text += " Lower-confidence match indicates possible diagnostic consideration requiring further evaluation."
+            strength = _VALIDATION_LOW
+        parts = [_VALIDATION_MATCH_TMPL % (confidence, condition_name), strength]
         if len(conditions) > 1:
-            other_conditions = []
-            for c in conditions[1:3]:
-                prob = round(c.get('probability', 0) * 100, 1)
-                name = c.get('common_name', c.get('name', 'Unknown'))
-                other_conditions.append(f"{name} ({prob}%)")
-            validation_text += f"\nDifferential diagnosis also considered: {', '.join(other_conditions)} based on symptom overlap analysis."
-        return validation_text
+            other_conditions = ", ".join(
+                f"{c.get('common_name', c.get('name', 'Unknown'))} ({round(c.get('probability', 0) * 100, 1)}%)"
+                for c in conditions[1:3]
+            )
+            parts.append(_VALIDATION_DIFFERENTIAL_TMPL % other_conditions)
+        return "".join(parts)
     def analyze_combined_symptoms(self, user_id, symptom_text, base64_img):
         """Combined Gemini analysis with text, image, and medical history"""
         try:
             if not base64_img or len(base64_img) < 100:
                 return "Sorry, the image data seems corrupted. Please try sending the image again."
-            history = get_user_history(user_id, days_back=365)
-            profile = get_user_profile(user_id)
-            profile_text = format_profile_for_analysis(profile)
+            result_key = _recent_result_key(user_id, symptom_text, base64_img)
+            recent = _get_recent_result(result_key)
+            if recent is not None:
+                return recent
+            history = get_user_history(user_id, days_back=365, limit=10)
+            profile_text = get_profile_text(user_id)
             history_text = format_medical_history_for_analysis(history)
             message = HumanMessage(
                 content=[
                     {
                         "type": "text",
-                        "text": f"""You are a medical AI assistant. Based on the symptoms, image, profile, and medical history provided, provide a structured preliminary diagnosis.
-CURRENT SYMPTOMS: "{symptom_text}"{profile_text}{history_text}
-CRITICAL: Detect the language of the user's symptoms text and respond in EXACTLY the same language. If the user wrote in Spanish, respond in Spanish. If they wrote in French, respond in French, etc.
-IMPORTANT: Consider the user's age and gender when providing analysis.
-Provide a structured response in this EXACT order:
-1. **Most Likely Diagnoses** (Top 2 most probable conditions based on all available information)
-2. **Home Remedies** (2-3 safe, simple remedies they can try at home)
-3. **Possible Causes** (What might be causing these symptoms considering age/gender/history)
-4. **Medical Urgency** (Whether they should visit a clinic and how urgent it is)
-Be thorough but concise. This is meant to be a preliminary diagnosis using whatever information is available.
-End with a medical disclaimer appropriate for the detected language (equivalent to: "I am an AI health assistant, not a doctor. Seek medical help for more accurate diagnoses.")"""
+                        "text": "".join((_COMBINED_PROMPT_HEAD, '"', symptom_text, '"', profile_text, history_text, _COMBINED_PROMPT_TAIL))
                     },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_img}"
-                        }
-                    }
+                    image_content_block(base64_img)
                 ]
             )
+            endlessmedical_future = _submit_endlessmedical_diagnosis(symptom_text, get_user_profile(user_id))
             gemini_result = self.llm.invoke([message])
             gemini_content = gemini_result.content if isinstance(gemini_result.content, str) else str(gemini_result.content)
-            endlessmedical_result = get_endlessmedical_diagnosis(symptom_text, profile)
+            endlessmedical_result = endlessmedical_future.result()
             validation_text = self._add_endlessmedical_validation("", endlessmedical_result)
-            processed_content = self._post_process_gemini_response(gemini_content + validation_text)
+            processed_content = self._post_process_gemini_response("".join((gemini_content, validation_text)))
             current_diagnosis = processed_content[:500] + "..." if len(processed_content) > 500 else processed_content
             platform = detect_platform(user_id)
             save_diagnosis_to_history(user_id, platform, symptom_text, current_diagnosis)
+            _remember_result(result_key, processed_content)
             return processed_content
-        except Exception as e:
-            print("Gemini combined analysis with history error:", e)
+        except Exception:
+            log.exception("Gemini combined analysis with history error")
             return "Sorry, I'm unable to process your request right now. Please try again."
     def analyze_text_symptoms(self, user_id, symptom_text):
         """Text-only Gemini analysis with profile and medical history"""
+        if not _is_valid_symptom_text(symptom_text):
+            return INVALID_SYMPTOMS_MSG
+        result_key = _recent_result_key(user_id, symptom_text)
+        recent = _get_recent_result(result_key)
+        if recent is not None:
+            return recent
         try:
-            profile = get_user_profile(user_id)
-            profile_text = format_profile_for_analysis(profile)
-            prompt = f"""You are a medical AI assistant. Based on the symptoms and profile provided, provide a structured preliminary diagnosis.
-USER SYMPTOMS: "{symptom_text}"
-User Profile Information:{profile_text}
-CRITICAL: Detect the language of the user's symptoms text and respond in EXACTLY the same language. If the user wrote in Spanish, respond in Spanish. If they wrote in French, respond in French, etc.
-IMPORTANT: Consider the user's age and gender in your analysis.
-Provide a structured response in this EXACT order:
-1. **Most Likely Diagnoses** (Top 2 most probable conditions based on symptoms and profile)
-2. **Home Remedies** (2-3 safe, simple remedies they can try at home)
-3. **Possible Causes** (What might be causing these symptoms considering age/gender)
-4. **Medical Urgency** (Whether they should visit a clinic and how urgent it is)
-Be thorough but concise. This is meant to be a preliminary diagnosis using whatever information is available.
-End with a medical disclaimer appropriate for the detected language (equivalent to: "I am an AI health assistant, not a doctor. Seek medical help for more accurate diagnoses.")"""
+            profile_text = get_profile_text(user_id)
+            prompt = "".join((_TEXT_PROMPT_HEAD, '"', symptom_text, '"', _TEXT_PROMPT_PROFILE, profile_text, _TEXT_PROMPT_TAIL))
+            endlessmedical_future = _submit_endlessmedical_diagnosis(symptom_text, get_user_profile(user_id))
             gemini_result = self.llm.invoke(prompt)
             gemini_content = gemini_result.content if isinstance(gemini_result.content, str) else str(gemini_result.content)
-            endlessmedical_result = get_endlessmedical_diagnosis(symptom_text, profile)
+            endlessmedical_result = endlessmedical_future.result()
             validation_text = self._add_endlessmedical_validation("", endlessmedical_result)
-            processed_content = self._post_process_gemini_response(gemini_content + validation_text)
+            processed_content = self._post_process_gemini_response("".join((gemini_content, validation_text)))
+            _remember_result(result_key, processed_content)
             return processed_content
-        except Exception as e:
-            print("Gemini text error:", e)
+        except Exception:
+            log.exception("Gemini text error")
             return "Sorry, I'm unable to process your request right now."
     def analyze_image_symptoms(self, user_id, base64_img):
         """Image-only Gemini analysis with profile"""
         try:
             if not base64_img or len(base64_img) < 100:
                 return "Sorry, the image data seems corrupted. Please try sending the image again."
-            profile = get_user_profile(user_id)
-            profile_text = format_profile_for_analysis(profile)
+            profile_text = get_profile_text(user_id)
             message = HumanMessage(
                 content=[
                     {
                         "type": "text",
-                        "text": f"""Based on this medical image and profile, provide a structured preliminary diagnosis.
-User Profile Information:{profile_text}
-CRITICAL: Since this is an image-only analysis, respond in English by default. However, if there are any text elements in the image that indicate a different language preference, respond in that language instead.
-IMPORTANT: Consider the user's age and gender when analyzing the image.
-Provide a structured response in this EXACT order:
-1. **Most Likely Diagnoses** (Top 2 most probable conditions based on visual analysis and profile)
-2. **Home Remedies** (2-3 safe, simple remedies they can try at home)
-3. **Possible Causes** (What might be causing what you see in the image)
-4. **Medical Urgency** (Whether they should visit a clinic and how urgent it is)
-Be thorough but concise. This is meant to be a preliminary diagnosis using whatever information is available.
-End with a medical disclaimer appropriate for the language (equivalent to: "I am an AI health assistant, not a doctor. Seek medical help for more accurate diagnoses.")"""
+                        "text": "".join((_IMAGE_PROMPT_HEAD, profile_text, _IMAGE_PROMPT_TAIL))
                     },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64_img}"
-                        }
-                    }
+                    image_content_block(base64_img)
                 ]
             )
             result = self.llm.invoke([message])
             content = result.content if isinstance(result.content, str) else str(result.content)
             processed_content = self._post_process_gemini_response(content)
             return processed_content
-        except Exception as e:
-            print("Gemini image error:", e)
+        except Exception:
+            log.exception("Gemini image error")
             return "Sorry, I couldn't analyze the image. Please try sending it again or describe your symptoms in text."
 medical_analysis_service = None
 def get_medical_analysis_service():
@@ -3,12 +3,24 @@ Pure Data Tools for LangGraph Medical Agent System
 Tools provide data only - LLM agent orchestrates and analyzes
 """
 import json
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Dict, Any, List
 from langchain_core.tools import tool
 from pydantic import BaseModel, Field
+from flask import current_app
 from datetime import datetime
-from models.user import get_user_profile, get_user_history, save_diagnosis_to_history, get_user_country, save_user_profile
+from models.user import UserProfile, get_user_profile, get_user_history, save_diagnosis_to_history, get_user_country, save_user_profile
 from services.external_apis import get_endlessmedical_diagnosis, check_disease_outbreaks_for_user, find_nearby_clinics, reverse_geocode, pubmed_search, set_endlessmedical_features, analyze_endlessmedical_session
+from utils.logger import get_logger
+log = get_logger(__name__)
+_geocode_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="geocode")
+def _submit_reverse_geocode(latitude, longitude):
+    """Start a reverse geocode in the background under the caller's app context"""
+    app = current_app._get_current_object()
+    def run():
+        with app.app_context():
+            return reverse_geocode(latitude, longitude)
+    return _geocode_executor.submit(run)
 class LocationInput(BaseModel):
     """Input schema for location-based tools"""
     latitude: float = Field(description="User's latitude coordinate")
@@ -40,26 +52,30 @@ class MedicalFeatureInput(BaseModel):
     features: Dict[str, str] = Field(description="Dictionary of medical features to set, e.g. {'Temp': '38.5', 'Headache': '1'}")
     age: Optional[int] = Field(default=None, description="Patient age")
     gender: Optional[str] = Field(default=None, description="Patient gender")
+class MedicalAnalysisInput(BaseModel):
+    """Input schema for analyzing previously set medical features"""
+    session_id: str = Field(description="session_id returned by set_medical_features")
 @tool("find_nearby_hospitals", args_schema=LocationInput)
 def find_nearby_hospitals(latitude: float, longitude: float, radius_km: int = 5) -> str:
     """
     Find nearby hospitals and medical facilities using location coordinates.
     Returns JSON list of nearby medical facilities with names, distances, and coordinates.
     """
-    print(f"🏥 TOOL CALLED: find_nearby_hospitals(lat={latitude}, lon={longitude}, radius={radius_km}km)")
+    log.info("🏥 TOOL CALLED: find_nearby_hospitals(lat=%s, lon=%s, radius=%skm)", latitude, longitude, radius_km)
     try:
-        location_name = reverse_geocode(latitude, longitude)
+        location_future = _submit_reverse_geocode(latitude, longitude)
         clinics = find_nearby_clinics(latitude, longitude, radius_km)
+        location_name = location_future.result()
         result = {
             "location": location_name,
             "search_radius_km": radius_km,
             "facilities_found": len(clinics),
-            "facilities": clinics
+            "facilities": [clinic._asdict() for clinic in clinics]
         }
-        print(f"✅ TOOL RESULT: Found {len(clinics)} facilities near {location_name}")
+        log.info("✅ TOOL RESULT: Found %d facilities near %s", len(clinics), location_name)
         return json.dumps(result, indent=2)
     except Exception as e:
-        print(f"❌ TOOL ERROR: find_nearby_hospitals failed - {str(e)}")
+        log.error("❌ TOOL ERROR: find_nearby_hospitals failed - %s", e)
         return json.dumps({"error": str(e)})
 @tool("set_medical_features", args_schema=MedicalFeatureInput)
 def set_medical_features(features: Dict[str, str], age: Optional[int] = None, gender: Optional[str] = None) -> str:
@@ -122,7 +138,7 @@ def set_medical_features(features: Dict[str, str], age: Optional[int] = None, ge
     - SkinHerpesRashHx: '1' (has herpes-type rash)
     Returns JSON with session results and features set.
     """
-    print(f"🔬 TOOL CALLED: set_medical_features(features={list(features.keys())}, age={age}, gender={gender})")
+    log.info("🔬 TOOL CALLED: set_medical_features(features=%s, age=%s, gender=%s)", list(features), age, gender)
     try:
         from services.external_apis import set_endlessmedical_features
         profile = {}
@@ -134,7 +150,7 @@ def set_medical_features(features: Dict[str, str], age: Optional[int] = None, ge
             features['Gender'] = gender.title()
         result = set_endlessmedical_features(features)
         if result and result.get('status') == 'success':
-            print(f"✅ TOOL RESULT: Set {result.get('total_features', 0)} medical features successfully")
+            log.info("✅ TOOL RESULT: Set %s medical features successfully", result.get('total_features', 0))
             return json.dumps({
                 "status": "success",
                 "features_set": result.get('features_set', []),
@@ -143,28 +159,28 @@ def set_medical_features(features: Dict[str, str], age: Optional[int] = None, ge
                 "total_features": result.get('total_features', 0)
             }, indent=2)
         else:
-            print(f"❌ TOOL ERROR: set_medical_features failed - {result.get('error') if result else 'Unknown error'}")
+            log.error("❌ TOOL ERROR: set_medical_features failed - %s", result.get('error') if result else 'Unknown error')
             return json.dumps({
                 "status": "failed",
                 "error": result.get('error') if result else "Unknown error",
                 "features_attempted": list(features.keys())
             })
     except Exception as e:
-        print(f"❌ TOOL ERROR: set_medical_features exception - {str(e)}")
+        log.error("❌ TOOL ERROR: set_medical_features exception - %s", e)
         return json.dumps({"error": str(e)})
-@tool("analyze_medical_features")  
-def analyze_medical_features() -> str:
+@tool("analyze_medical_features", args_schema=MedicalAnalysisInput)
+def analyze_medical_features(session_id: str) -> str:
     """
     Analyze the medical features that were previously set using set_medical_features.
-    This should be called AFTER set_medical_features to get the diagnosis.
+    This should be called AFTER set_medical_features, passing the session_id it returned.
     Returns JSON with possible conditions and probabilities from EndlessMedical database.
     """
-    print(f"🧬 TOOL CALLED: analyze_medical_features()")
+    log.info("🧬 TOOL CALLED: analyze_medical_features(session_id=%s)", session_id)
     try:
-        result = analyze_endlessmedical_session()
+        result = analyze_endlessmedical_session(session_id)
         if result and result.get('status') == 'success':
             conditions_count = len(result.get('conditions', []))
-            print(f"✅ TOOL RESULT: Found {conditions_count} potential conditions from EndlessMedical")
+            log.info("✅ TOOL RESULT: Found %d potential conditions from EndlessMedical", conditions_count)
             return json.dumps({
                 "status": "success", 
                 "conditions": result.get('conditions', []),
@@ -172,14 +188,14 @@ def analyze_medical_features() -> str:
                 "analysis_date": result.get('date')
             }, indent=2)
         else:
-            print(f"⚠️ TOOL RESULT: No conditions found in EndlessMedical database")
+            log.warning("⚠️ TOOL RESULT: No conditions found in EndlessMedical database")
             return json.dumps({
                 "status": "no_results",
                 "message": "No specific conditions found in clinical database",
                 "error": result.get('error') if result else None
             })
     except Exception as e:
-        print(f"❌ TOOL ERROR: analyze_medical_features exception - {str(e)}")
+        log.error("❌ TOOL ERROR: analyze_medical_features exception - %s", e)
         return json.dumps({"error": str(e)})
 @tool("search_medical_database", args_schema=MedicalSearchInput)
 def search_medical_database(symptoms: str, age: Optional[int] = None, gender: Optional[str] = None) -> str:
@@ -192,12 +208,12 @@ def search_medical_database(symptoms: str, age: Optional[int] = None, gender: Op
     3. This tool provides a simpler interface but may be less accurate
     Returns JSON with possible conditions, probabilities, and medical information.
     """
-    print(f"🔍 TOOL CALLED: search_medical_database(symptoms='{symptoms[:50]}...', age={age}, gender={gender})")
+    log.info("🔍 TOOL CALLED: search_medical_database(symptoms='%.50s...', age=%s, gender=%s)", symptoms, age, gender)
     try:
-        result = get_endlessmedical_diagnosis(symptoms, {'age': age, 'gender': gender} if age or gender else {})
+        result = get_endlessmedical_diagnosis(symptoms, UserProfile(age, gender, None) if age or gender else None)
         if result and result.get('status') == 'success':
             conditions_count = len(result.get('conditions', []))
-            print(f"✅ TOOL RESULT: Found {conditions_count} conditions for symptoms: {symptoms[:30]}...")
+            log.info("✅ TOOL RESULT: Found %d conditions for symptoms: %.30s...", conditions_count, symptoms)
             return json.dumps({
                 "status": "success",
                 "symptoms_analyzed": symptoms,
@@ -207,14 +223,14 @@ def search_medical_database(symptoms: str, age: Optional[int] = None, gender: Op
                 "note": "For more accurate results, use set_medical_features + analyze_medical_features"
             }, indent=2)
         else:
-            print(f"⚠️ TOOL RESULT: No conditions found for symptoms: {symptoms[:30]}...")
+            log.warning("⚠️ TOOL RESULT: No conditions found for symptoms: %.30s...", symptoms)
             return json.dumps({
                 "status": "no_results",
                 "symptoms_analyzed": symptoms,
                 "message": "No specific conditions found in clinical database. Try using set_medical_features for more precise symptom mapping."
             })
     except Exception as e:
-        print(f"❌ TOOL ERROR: search_medical_database exception - {str(e)}")
+        log.error("❌ TOOL ERROR: search_medical_database exception - %s", e)
         return json.dumps({"error": str(e)})
 @tool("web_search_medical", args_schema=WebSearchInput)
 def web_search_medical(query: str, max_results: int = 5) -> str:
@@ -222,11 +238,11 @@ def web_search_medical(query: str, max_results: int = 5) -> str:
     Search PubMed for medical research articles and clinical information.
     Returns JSON with peer-reviewed medical literature from PubMed database.
     """
-    print(f"📚 TOOL CALLED: web_search_medical(query='{query}', max_results={max_results})")
+    log.info("📚 TOOL CALLED: web_search_medical(query='%s', max_results=%s)", query, max_results)
     try:
         results = pubmed_search(query, max_results)
         articles_found = len(results) if results else 0
-        print(f"✅ TOOL RESULT: Found {articles_found} PubMed articles for query: {query}")
+        log.info("✅ TOOL RESULT: Found %s PubMed articles for query: %s", articles_found, query)
         return json.dumps({
             "query": query,
             "results_count": len(results),
@@ -235,7 +251,7 @@ def web_search_medical(query: str, max_results: int = 5) -> str:
             "description": "Peer-reviewed medical literature and research articles"
         }, indent=2)
     except Exception as e:
-        print(f"❌ TOOL ERROR: web_search_medical exception - {str(e)}")
+        log.error("❌ TOOL ERROR: web_search_medical exception - %s", e)
         return json.dumps({"error": str(e)})
 @tool("get_user_profile", args_schema=UserProfileInput)
 def get_user_profile_tool(user_id: str) -> str:
@@ -243,23 +259,26 @@ def get_user_profile_tool(user_id: str) -> str:
     Retrieve user profile information from database.
     Returns JSON with user's age, gender, medical history, and platform.
     """
-    print(f"👤 TOOL CALLED: get_user_profile(user_id={user_id})")
+    log.info("👤 TOOL CALLED: get_user_profile(user_id=%s)", user_id)
     try:
         profile = get_user_profile(user_id)
         history = get_user_history(user_id, days_back=365)
         country = get_user_country(user_id)
         history_count = len(history) if history else 0
-        print(f"✅ TOOL RESULT: Retrieved profile for {user_id} - {history_count} history entries, country: {country or 'None'}")
+        log.info("✅ TOOL RESULT: Retrieved profile for %s - %s history entries, country: %s", user_id, history_count, country)
         result = {
             "user_id": user_id,
-            "profile": profile,
-            "medical_history": history,
+            "profile": profile._asdict() if profile else None,
+            "medical_history": [
+                (symptoms, diagnosis, datetime.fromtimestamp(timestamp).isoformat(sep=' ', timespec='seconds'), body_part, severity)
+                for symptoms, diagnosis, timestamp, body_part, severity in history
+            ],
             "country": country,
             "history_entries": len(history) if history else 0
         }
         return json.dumps(result, indent=2)
     except Exception as e:
-        print(f"❌ TOOL ERROR: get_user_profile exception - {str(e)}")
+        log.error("❌ TOOL ERROR: get_user_profile exception - %s", e)
         return json.dumps({"error": str(e)})
 @tool("save_user_profile", args_schema=UserProfileInput)
 def save_user_profile_tool(user_id: str, age: Optional[int] = None, gender: Optional[str] = None, platform: Optional[str] = None) -> str:
@@ -267,10 +286,10 @@ def save_user_profile_tool(user_id: str, age: Optional[int] = None, gender: Opti
     Save user profile information to database.
     Returns confirmation of saved profile data.
     """
-    print(f"💾 TOOL CALLED: save_user_profile(user_id={user_id}, age={age}, gender={gender}, platform={platform})")
+    log.info("💾 TOOL CALLED: save_user_profile(user_id=%s, age=%s, gender=%s, platform=%s)", user_id, age, gender, platform)
     try:
         save_user_profile(user_id, age, gender, platform)
-        print(f"✅ TOOL RESULT: Saved profile for {user_id} - age: {age}, gender: {gender}")
+        log.info("✅ TOOL RESULT: Saved profile for %s - age: %s, gender: %s", user_id, age, gender)
         result = {
             "status": "success",
             "user_id": user_id,
@@ -282,7 +301,7 @@ def save_user_profile_tool(user_id: str, age: Optional[int] = None, gender: Opti
         }
         return json.dumps(result, indent=2)
     except Exception as e:
-        print(f"❌ TOOL ERROR: save_user_profile exception - {str(e)}")
+        log.error("❌ TOOL ERROR: save_user_profile exception - %s", e)
         return json.dumps({"error": str(e)})
 class OutbreakCheckInput(BaseModel):
     """Input schema for disease outbreak checking"""
@@ -296,19 +315,19 @@ def check_disease_outbreaks(user_id: str, country: Optional[str] = None, platfor
     If country is provided, saves it to database for future reference.
     Returns JSON with current outbreak information from WHO Disease Outbreak News.
     """
-    print(f"🌍 TOOL CALLED: check_disease_outbreaks(user_id={user_id}, country={country}, platform={platform})")
+    log.info("🌍 TOOL CALLED: check_disease_outbreaks(user_id=%s, country=%s, platform=%s)", user_id, country, platform)
     try:
         if country and country.strip():
             from models.user import save_user_country
             save_success = save_user_country(user_id, country.strip(), platform)
             if save_success:
-                print(f"✅ COUNTRY SAVED: '{country}' saved for user {user_id}")
+                log.info("✅ COUNTRY SAVED: '%s' saved for user %s", country, user_id)
             else:
-                print(f"⚠️ COUNTRY SAVE FAILED: Failed to save '{country}' for user {user_id}")
+                log.warning("⚠️ COUNTRY SAVE FAILED: Failed to save '%s' for user %s", country, user_id)
         outbreaks = check_disease_outbreaks_for_user(user_id)
         saved_country = get_user_country(user_id)
         outbreak_count = len(outbreaks) if outbreaks else 0
-        print(f"✅ TOOL RESULT: Found {outbreak_count} outbreaks for {saved_country or 'unknown location'}")
+        log.info("✅ TOOL RESULT: Found %d outbreaks for %s", outbreak_count, saved_country or 'unknown location')
         
         if not saved_country:
             return json.dumps({
@@ -335,7 +354,7 @@ def check_disease_outbreaks(user_id: str, country: Optional[str] = None, platfor
             result["message"] = f"No active disease outbreaks currently reported for {saved_country} in WHO Disease Outbreak News."
         return json.dumps(result, indent=2)
     except Exception as e:
-        print(f"❌ TOOL ERROR: check_disease_outbreaks exception - {str(e)}")
+        log.error("❌ TOOL ERROR: check_disease_outbreaks exception - %s", e)
         error_result = {
             "status": "error",
             "error": str(e),
@@ -352,12 +371,12 @@ def final_diagnosis(user_id: str, symptoms: str, diagnosis: str, confidence: flo
     Save final diagnosis to user's medical history.
     Returns confirmation of saved diagnosis.
     """
-    print(f"📋 TOOL CALLED: final_diagnosis(user_id={user_id}, symptoms='{symptoms[:50]}...', confidence={confidence})")
+    log.info("📋 TOOL CALLED: final_diagnosis(user_id=%s, symptoms='%.50s...', confidence=%s)", user_id, symptoms, confidence)
     try:
         profile = get_user_profile(user_id)
-        platform = profile.get('platform', 'unknown') if profile else 'unknown'
+        platform = profile.platform if profile and profile.platform else 'unknown'
         history_id = save_diagnosis_to_history(user_id, platform, symptoms, diagnosis)
-        print(f"✅ TOOL RESULT: Saved diagnosis to history (ID: {history_id}) - symptoms: {symptoms[:30]}...")
+        log.info("✅ TOOL RESULT: Saved diagnosis to history (ID: %s) - symptoms: %.30s...", history_id, symptoms)
         result = {
             "status": "diagnosis_saved",
             "user_id": user_id,
@@ -369,7 +388,7 @@ def final_diagnosis(user_id: str, symptoms: str, diagnosis: str, confidence: flo
         }
         return json.dumps(result, indent=2)
     except Exception as e:
-        print(f"❌ TOOL ERROR: final_diagnosis exception - {str(e)}")
+        log.error("❌ TOOL ERROR: final_diagnosis exception - %s", e)
         return json.dumps({"error": str(e)})
 MEDICAL_TOOLS = [
     web_search_medical,
@@ -30,20 +30,19 @@ class MessageProcessor:
         return hashlib.md5(request_string.encode()).hexdigest()
     
     def _clean_old_requests(self):
-        """Clean request tracking older than 10 minutes"""
+        """Clean request tracking older than 10 minutes; caller must hold self._lock"""
         cutoff = datetime.now() - timedelta(minutes=10)
-        with self._lock:
-            # Clean processing requests
-            to_remove = [req_hash for req_hash, timestamp in self.processing_requests.items() 
-                        if timestamp < cutoff]
-            for req_hash in to_remove:
-                del self.processing_requests[req_hash]
-            
-            # Clean completed requests  
-            to_remove = [req_hash for req_hash, (timestamp, _) in self.completed_requests.items()
-                        if timestamp < cutoff]
-            for req_hash in to_remove:
-                del self.completed_requests[req_hash]
+        # Clean processing requests
+        to_remove = [req_hash for req_hash, timestamp in self.processing_requests.items() 
+                    if timestamp < cutoff]
+        for req_hash in to_remove:
+            del self.processing_requests[req_hash]
+        
+        # Clean completed requests  
+        to_remove = [req_hash for req_hash, (timestamp, _) in self.completed_requests.items()
+                    if timestamp < cutoff]
+        for req_hash in to_remove:
+            del self.completed_requests[req_hash]
     
     def _is_duplicate_request(self, user_id, message_type, content):
         """Check if this request is already being processed or was recently completed"""
@@ -1,5 +1,7 @@
 """Message service for WhatsApp and Telegram communication"""
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 import base64
 import threading
 import hashlib
@@ -7,17 +9,20 @@ from datetime import datetime, timedelta
 from flask import current_app
 from utils.helpers import truncate_text
 
+# Shared keep-alive session for Telegram and WhatsApp API calls
+_messaging_session = requests.Session()
+_messaging_session.mount('https://', HTTPAdapter(pool_connections=16, pool_maxsize=64))
+
 # Message sending deduplication
 _sent_messages = {}
 _send_lock = threading.Lock()
 
 def _clean_sent_messages():
-    """Clean sent messages older than 2 minutes"""
+    """Clean sent messages older than 2 minutes; caller must hold _send_lock"""
     cutoff = datetime.now() - timedelta(minutes=2)
-    with _send_lock:
-        to_remove = [msg_hash for msg_hash, timestamp in _sent_messages.items() if timestamp < cutoff]
-        for msg_hash in to_remove:
-            del _sent_messages[msg_hash]
+    to_remove = [msg_hash for msg_hash, timestamp in _sent_messages.items() if timestamp < cutoff]
+    for msg_hash in to_remove:
+        del _sent_messages[msg_hash]
 
 def _generate_message_hash(recipient, message):
     """Generate hash for message deduplication"""
@@ -60,7 +65,7 @@ def send_whatsapp_message(recipient, message):
             "type": "text",
             "text": {"body": truncate_text(message, max_length)}
         }
-        res = requests.post(url, json=payload, headers=headers)
+        res = _messaging_session.post(url, json=payload, headers=headers)
         print(f"WhatsApp message sent. Status: {res.status_code}, Response: {res.text}")
         return res.status_code == 200
     except Exception as e:
@@ -81,8 +86,8 @@ def send_telegram_message(chat_id, text):
             "chat_id": chat_id, 
             "text": truncate_text(text, max_length)
         }
-        res = requests.post(url, json=payload, timeout=10)
-        if res.status_code == 200 and res.json().get('ok'):
+        res = _messaging_session.post(url, json=payload, timeout=10)
+        if res.status_code == 200 and orjson.loads(res.content).get('ok'):
             return True
         return False
     except Exception as e:
@@ -95,11 +100,11 @@ def get_whatsapp_image_url(media_id):
         whatsapp_token = current_app.config.get('WHATSAPP_TOKEN')
         url = f"https://graph.facebook.com/v19.0/{media_id}"
         headers = {"Authorization": f"Bearer {whatsapp_token}"}
-        res = requests.get(url, headers=headers)
+        res = _messaging_session.get(url, headers=headers)
         if res.status_code != 200:
             print(f"Error getting image URL: {res.status_code}, {res.text}")
             return None
-        return res.json().get('url')
+        return orjson.loads(res.content).get('url')
     except Exception as e:
         print(f"Error in get_whatsapp_image_url: {e}")
         return None
@@ -109,7 +114,7 @@ def download_and_encode_whatsapp_image(image_url):
     try:
         whatsapp_token = current_app.config.get('WHATSAPP_TOKEN')
         headers = {"Authorization": f"Bearer {whatsapp_token}"}
-        res = requests.get(image_url, headers=headers)
+        res = _messaging_session.get(image_url, headers=headers)
         if res.status_code != 200:
             print(f"Error downloading image: {res.status_code}, {res.text}")
             return None
@@ -121,17 +126,17 @@ def download_and_encode_whatsapp_image(image_url):
         print(f"Error in download_and_encode_whatsapp_image: {e}")
         return None
 
-def get_telegram_file_path(file_id):
+def get_telegram_file_path(file_id, telegram_token=None):
     """Get Telegram file path from file ID"""
     try:
-        telegram_token = current_app.config.get('TELEGRAM_BOT_TOKEN')
+        telegram_token = telegram_token or current_app.config.get('TELEGRAM_BOT_TOKEN')
         url = f"https://api.telegram.org/bot{telegram_token}/getFile"
         payload = {"file_id": file_id}
-        res = requests.post(url, json=payload, timeout=10)
+        res = _messaging_session.post(url, json=payload, timeout=10)
         if res.status_code != 200:
             print(f"Error getting Telegram file path: {res.status_code}, {res.text}")
             return None
-        result = res.json()
+        result = orjson.loads(res.content)
         if result.get('ok'):
             return result.get('result', {}).get('file_path')
         return None
@@ -142,7 +147,7 @@ def get_telegram_file_path(file_id):
 def download_telegram_image(file_url):
     """Download and base64 encode Telegram image"""
     try:
-        res = requests.get(file_url, timeout=30)
+        res = _messaging_session.get(file_url, timeout=30)
         if res.status_code != 200:
             print(f"Error downloading Telegram image: {res.status_code}, {res.text}")
             return None
@@ -154,14 +159,22 @@ def download_telegram_image(file_url):
         print(f"Error in download_telegram_image: {e}")
         return None
 
+def download_telegram_photo(file_id):
+    """Resolve a Telegram file ID and download it as base64, reading the bot token once"""
+    telegram_token = current_app.config.get('TELEGRAM_BOT_TOKEN')
+    file_path = get_telegram_file_path(file_id, telegram_token)
+    if not file_path:
+        return None
+    return download_telegram_image(f"https://api.telegram.org/file/bot{telegram_token}/{file_path}")
+
 def test_telegram_token():
     """Test if Telegram bot token is valid"""
     try:
         telegram_token = current_app.config.get('TELEGRAM_BOT_TOKEN')
         url = f"https://api.telegram.org/bot{telegram_token}/getMe"
-        response = requests.get(url, timeout=10)
+        response = _messaging_session.get(url, timeout=10)
         if response.status_code == 200:
-            data = response.json()
+            data = orjson.loads(response.content)
             if data.get('ok'):
                 return True
             return False
@@ -175,9 +188,9 @@ def get_telegram_bot_info():
     try:
         telegram_token = current_app.config.get('TELEGRAM_BOT_TOKEN')
         url = f"https://api.telegram.org/bot{telegram_token}/getMe"
-        response = requests.get(url, timeout=10)
+        response = _messaging_session.get(url, timeout=10)
         if response.status_code == 200:
-            data = response.json()
+            data = orjson.loads(response.content)
             if data.get('ok'):
                 return data.get('result', {})
             return None
@@ -191,9 +204,9 @@ def get_telegram_webhook_info():
     try:
         telegram_token = current_app.config.get('TELEGRAM_BOT_TOKEN')
         url = f"https://api.telegram.org/bot{telegram_token}/getWebhookInfo"
-        response = requests.get(url, timeout=10)
+        response = _messaging_session.get(url, timeout=10)
         if response.status_code == 200:
-            return response.json().get('result', {})
+            return orjson.loads(response.content).get('result', {})
         return None
     except Exception as e:
         print(f"Error getting webhook info: {e}")
@@ -204,14 +217,14 @@ def set_telegram_webhook(webhook_url):
     try:
         telegram_token = current_app.config.get('TELEGRAM_BOT_TOKEN')
         delete_url = f"https://api.telegram.org/bot{telegram_token}/deleteWebhook"
-        requests.post(delete_url, timeout=10)
+        _messaging_session.post(delete_url, timeout=10)
         set_url = f"https://api.telegram.org/bot{telegram_token}/setWebhook"
         payload = {
             "url": f"{webhook_url}/webhook/telegram",
             "allowed_updates": ["message", "callback_query"]
         }
-        res = requests.post(set_url, json=payload, timeout=10)
-        if res.status_code == 200 and res.json().get('ok'):
+        res = _messaging_session.post(set_url, json=payload, timeout=10)
+        if res.status_code == 200 and orjson.loads(res.content).get('ok'):
             return True
         return False
     except Exception as e:
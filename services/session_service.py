@@ -1,11 +1,14 @@
 """Session service for managing user sessions and profile setup"""
 import threading
+import time
 from datetime import datetime, timedelta
 from models.user import save_user_profile, is_new_user
 from services.message_service import send_whatsapp_message, send_telegram_message
 from utils.constants import *
 from utils.helpers import is_inactive_session, detect_platform
 
+_CLEANUP_INTERVAL = 30
+
 class SessionService:
     """
     Enhanced session service for LangGraph medical agent system
@@ -22,6 +25,7 @@ class SessionService:
         self.user_sessions = {}
         self.profile_setup_sessions = {}
         self._lock = threading.RLock()  # DEADLOCK FIX: Use RLock (reentrant) instead of Lock
+        self._last_cleanup = 0.0
     def get_session(self, user_id):
         """Get or create user session"""
         if user_id not in self.user_sessions:
@@ -53,9 +57,13 @@ class SessionService:
             "conversation_context": []
         }
     def clear_inactive_sessions(self, hours_threshold=48):
-        """Clear sessions for users inactive for more than specified hours"""
+        """Clear sessions for users inactive for more than specified hours, at most every 30 seconds"""
+        now = time.monotonic()
+        if now - self._last_cleanup < _CLEANUP_INTERVAL:
+            return
+        self._last_cleanup = now
         inactive_users = []
-        for user_id, session in self.user_sessions.items():
+        for user_id, session in list(self.user_sessions.items()):
             last_activity = session.get('last_activity', datetime.now())
             if is_inactive_session(last_activity, hours_threshold):
                 inactive_users.append(user_id)
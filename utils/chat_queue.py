@@ -0,0 +1,36 @@
+"""Per-chat ordering for messages handled on worker pools"""
+import threading
+from collections import deque
+from utils.logger import get_logger
+log = get_logger(__name__)
+class ChatQueue:
+    """Run each chat's messages one at a time, in arrival order, while different chats run in parallel"""
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+    def submit(self, executor, chat_id, fn, *args):
+        """Queue fn(*args) on executor behind any earlier work for chat_id"""
+        job = (executor, fn, args)
+        with self._lock:
+            pending = self._pending.get(chat_id)
+            if pending is not None:
+                pending.append(job)
+                return
+            self._pending[chat_id] = deque()
+        self._start(chat_id, job)
+    def _start(self, chat_id, job):
+        executor, fn, args = job
+        executor.submit(self._run, chat_id, fn, args)
+    def _run(self, chat_id, fn, args):
+        try:
+            fn(*args)
+        except Exception:
+            log.exception("Error handling queued message for %s", chat_id)
+        # Hand the chat's next message back to its own pool so other chats get a turn
+        with self._lock:
+            pending = self._pending[chat_id]
+            if not pending:
+                del self._pending[chat_id]
+                return
+            job = pending.popleft()
+        self._start(chat_id, job)
@@ -41,6 +41,7 @@ NO_RECENT_DIAGNOSIS_MSG = "No recent diagnosis found to provide feedback for."
 FEEDBACK_THANKS_MSG = "Thank you for your {feedback} feedback! 🙏\n\nFeel free to ask about new symptoms or type 'history' to see past consultations."
 LOCATION_RECEIVED_MSG = "📍 Location received: {address}\n\nNow you can share your symptoms or send an image for analysis!"
 IMAGE_ERROR_MSG = "Sorry, I couldn't download the image. Please try sending it again."
+INVALID_SYMPTOMS_MSG = "Please describe your symptoms in a few words (e.g., 'headache and fever since yesterday') so I can analyze them."
 # LangGraph Medical Agent System Prompt
 MEDICAL_AGENT_SYSTEM_PROMPT = """You are a medical AI assistant with access to PubMed research database, medical literature, and WHO Disease Outbreak News. You provide evidence-based medical guidance through natural conversation, like a knowledgeable medical chatbot.
 
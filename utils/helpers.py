@@ -1,5 +1,6 @@
 """Utility functions used throughout the application"""
 import math
+import numpy as np
 from datetime import datetime, timedelta
 def detect_platform(user_id):
     """Detect if user is from Telegram or WhatsApp based on user_id format"""
@@ -16,13 +17,30 @@ def calculate_distance(lat1, lon1, lat2, lon2):
     c = 2 * math.asin(math.sqrt(a))
     r = 6371
     return c * r
+def calculate_distances(lat, lon, lats, lons):
+    """Vectorized Haversine distance (km) from one point to arrays of points"""
+    lat0, lon0 = math.radians(lat), math.radians(lon)
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    a = np.sin((lats - lat0) / 2) ** 2 + math.cos(lat0) * np.cos(lats) * np.sin((lons - lon0) / 2) ** 2
+    return 2 * 6371 * np.arcsin(np.sqrt(a))
+def nearest_indices(distances, k):
+    """Indices of the k smallest distances, nearest first, without a full sort"""
+    if len(distances) > k:
+        candidates = np.argpartition(distances, k)[:k]
+    else:
+        candidates = np.arange(len(distances))
+    return candidates[np.argsort(distances[candidates])]
+def image_content_block(base64_img, mime_type="image/jpeg"):
+    """Build a base64 image block for Gemini messages without wrapping it in a data URL"""
+    return {"type": "image", "base64": base64_img, "mime_type": mime_type}
 def format_history_text(history):
     """Format user history for display"""
     if not history:
         return "📋 Your Recent Medical History:\n\nNo medical history found."
     history_text = "📋 Your Recent Medical History:\n\n"
     for i, (symptoms, diagnosis, timestamp, body_part, severity) in enumerate(history[:5], 1):
-        date_str = datetime.fromisoformat(timestamp).strftime("%b %d, %Y")
+        date_str = datetime.fromtimestamp(timestamp).strftime("%b %d, %Y")
         history_text += f"{i}. {date_str}: {symptoms[:50]}...\n"
     return history_text
 def format_medical_history_for_analysis(history):
@@ -31,15 +49,15 @@ def format_medical_history_for_analysis(history):
         return "\n\nUSER'S MEDICAL HISTORY: No previous consultations found."
     history_text = "\n\nUSER'S MEDICAL HISTORY (Past 12 months):\n"
     for i, (past_symptoms, past_diagnosis, timestamp, body_part, severity) in enumerate(history[:10], 1):
-        date_str = datetime.fromisoformat(timestamp).strftime("%b %d, %Y")
+        date_str = datetime.fromtimestamp(timestamp).strftime("%b %d, %Y")
         history_text += f"{i}. {date_str}: Symptoms: {past_symptoms} | Diagnosis: {past_diagnosis}\n"
     return history_text
 def format_profile_for_analysis(profile):
     """Format user profile for medical analysis prompts"""
     if not profile:
         return "\n\nUSER PROFILE: No profile information available"
-    age_text = f"Age: {profile['age']}" if profile['age'] else "Age: Not provided"
-    gender_text = f"Gender: {profile['gender']}" if profile['gender'] else "Gender: Not provided"
+    age_text = f"Age: {profile.age}" if profile.age else "Age: Not provided"
+    gender_text = f"Gender: {profile.gender}" if profile.gender else "Gender: Not provided"
     return f"\n\nUSER PROFILE:\n{age_text}\n{gender_text}"
 def is_country_mention(text, country_keywords):
     """Check if text contains country name"""
@@ -72,10 +90,10 @@ def format_clinic_recommendations(clinics, address):
     
     for i, clinic in enumerate(clinics, 1):
         # Direct navigation/directions link only
-        directions_link = f"https://www.google.com/maps/dir/?api=1&destination={clinic['lat']},{clinic['lon']}&destination_place_id={clinic['name'].replace(' ', '+').replace('&', 'and')}"
+        directions_link = f"https://www.google.com/maps/dir/?api=1&destination={clinic.lat},{clinic.lon}&destination_place_id={clinic.name.replace(' ', '+').replace('&', 'and')}"
         
-        clinic_text += (f"{i}. **{clinic['name']}** ({clinic['type'].title()})\n"
-                       f"   📍 {clinic['distance']}km away\n"
+        clinic_text += (f"{i}. **{clinic.name}** ({clinic.type.title()})\n"
+                       f"   📍 {clinic.distance}km away\n"
                        f"   🗺️ [Get Directions]({directions_link})\n\n")
     
     clinic_text += ("💡 **Tips:**\n"
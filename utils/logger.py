@@ -0,0 +1,20 @@
+"""Application logging routed through a background queue listener"""
+import atexit
+import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from config import Config
+_log_queue = queue.Queue(-1)
+_stream_handler = logging.StreamHandler(sys.stdout)
+_stream_handler.setFormatter(logging.Formatter("%(message)s"))
+_listener = QueueListener(_log_queue, _stream_handler)
+_app_logger = logging.getLogger("medsense")
+_app_logger.setLevel(Config.LOG_LEVEL)
+_app_logger.addHandler(QueueHandler(_log_queue))
+_app_logger.propagate = False
+_listener.start()
+atexit.register(_listener.stop)
+def get_logger(name):
+    """Get a module logger whose records are written by the background listener"""
+    return logging.getLogger(f"medsense.{name}")